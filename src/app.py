@@ -1,21 +1,38 @@
 import streamlit as st
-import pandas as pd
 import os
-from watcher import BACKUP_DIR
+import pandas as pd
 from extract import main as parse_matchfiles
-from extract import parse_xml, RESULT_DIR
+from extract import parse_xml, ingest, load_run_stats, load_quarantine, retry_quarantined
+from profiles import load_profiles, save_profile, DEFAULT_PROFILE
+from store import exists as store_exists
+from dataset import (
+    get_matches_version,
+    get_combined_version,
+    load_combined_matches,
+    load_matches,
+    load_summary,
+    load_my_id,
+    load_match_display_names,
+    load_match,
+    load_profileid_map,
+    load_teammate_effects,
+    load_players,
+    load_player_search_names,
+)
 from plots import (
     plot_mmr_hisotry, 
-    get_KD, 
     display_mmr_KPIs, 
     display_fighting_KPIs, 
+    display_metrics,
     effect_on_success_chance, 
     plot_match_endings,
     plot_team_sizes,
+    plot_player_mmr_history,
 )
 from dotenv import load_dotenv, set_key, find_dotenv
 from glob import glob
-from match_utils import find_my_id, simplify_scoreboard, construct_match_name, predict_mmr
+from match_utils import simplify_scoreboard, SUCCESS_TARGETS
+from kpis import get_KD
 import subprocess
 import sys
 from utils import set_png_as_page_bg
@@ -47,14 +64,27 @@ def start_watcher_process():
     else:
         st.error("Match Recorder failed.")
 
+def save_setting(key, value):
+    # the default profile is set up in the .env file, all other ones in the profiles file
+    if profile.name == DEFAULT_PROFILE:
+        set_key(find_dotenv(), key, value)
+        load_dotenv(override=True) # force reload env vars
+    else:
+        save_profile(profile.name, **{key: value})
+
 
 st.title("Hunt Journal")
 set_png_as_page_bg("static/WebPage-background-5.jpg")
-total, single, settings = st.tabs(["Overall Statistics", "Individual Match Results", "Match Recorder"])
+profiles = load_profiles()
+if len(profiles) > 1:
+    profile = profiles[st.selectbox("Profile", profiles.keys(), help="Every player of the clan has their own matches and statistics.")]
+else:
+    profile = profiles[DEFAULT_PROFILE]
+total, single, hunters, settings = st.tabs(["Overall Statistics", "Individual Match Results", "Hunters", "Match Recorder"])
 
 with settings:
     # starting the game and match recorder
-    tracked_file_is_setup = os.path.exists(os.getenv("watched_file") or "")
+    tracked_file_is_setup = any(os.path.exists(p.watched_file or "") for p in profiles.values())
     process_alive = st.session_state.get("watcher_process") is not None
     col0, col1 = st.columns(2)
     with col0: 
@@ -73,6 +103,14 @@ with settings:
     with col1:
         if st.button("Start Match Recorder", disabled = not tracked_file_is_setup):
             start_watcher_process()
+        live_ingestion = st.checkbox(
+            label = "Update Statistics while recording",
+            value = os.getenv("live_ingestion") == "true",
+            help = "The Match Recorder reads every new match right away, so there is no need to press `Calculate Statistics`. Takes effect when the Match Recorder is started.",
+        )
+        if str(live_ingestion).lower() != os.getenv("live_ingestion", "false"):
+            set_key(find_dotenv(), "live_ingestion", str(live_ingestion).lower())
+            load_dotenv(override=True)
         
 
     st.caption("About the data collection")
@@ -88,21 +126,20 @@ with settings:
     with col1:
         filepath = st.text_input(
             "Set the path to Matchfile",
-            value = os.getenv("watched_file") or os.path.join("C:", "Program Files (x86)", "Steam", "steamapps", "common", "Hunt Showdown", "user", "profiles", "default", "attributes.xml"),
+            value = profile.watched_file or os.path.join("C:", "Program Files (x86)", "Steam", "steamapps", "common", "Hunt Showdown", "user", "profiles", "default", "attributes.xml"),
             help = "The file will be somewhere like `/steamapps/common/Hunt Showdown/user/profiles/default/attributes.xml`"
         )
         try:
-            with open(filepath, "r", errors="ignore") as infile:
+            with open(filepath, "rb") as infile:
                 xml = infile.read()
             parse_xml(xml)
         except Exception as e:
             st.error(f"Invalid Matchfile: {e}")
         else:
             st.success("Valid Matchfile.")
-            set_key(find_dotenv(), "watched_file", filepath) # write vars
-            load_dotenv(override=True) # force reload env vars
-        backup_dir = os.getenv("backup_dir") or BACKUP_DIR
-        st.info(f"Backup Location: `{os.path.abspath(backup_dir)}`")
+            if filepath != profile.watched_file:
+                save_setting("watched_file", filepath)
+        st.info(f"Backup Location: `{os.path.abspath(profile.backup_dir)}`")
 
 
     st.caption("After you collected some data")
@@ -115,7 +152,7 @@ with settings:
     with col1:
         parse_resultfiles = st.button(
             label = "Calculate Statistics",
-            disabled = len(glob("data/raw/*.xml")) == 0,
+            disabled = len(glob(os.path.join(profile.backup_dir, "*.xml"))) == 0,
             help = "Read data form copied matchfiles."
         )
         check_sanity = st.checkbox(
@@ -123,25 +160,100 @@ with settings:
             False,
             help = "Use some simple heuristics to validate wether the data for each match makes sense. Enable if matches in your hisotry look weird.",
         )
+        rebuild = st.checkbox(
+            "Rebuild from scratch",
+            False,
+            help = "By default only new matchfiles are read. Enable to read in all matchfiles again.",
+        )
+        my_profileid = st.text_input(
+            "Your Hunter ID",
+            value = profile.my_profileid or "",
+            help = "Leave empty to detect it from the matches. Only set it if the statistics are shown for the wrong Hunter. Takes effect when calculating the statistics.",
+        )
+        if my_profileid.strip() != (profile.my_profileid or ""):
+            save_setting("my_profileid", my_profileid.strip())
     if parse_resultfiles:
         placeholder = st.empty()
         with placeholder.container():
             st.write("Parsing Match result files...")
             bar = st.progress(0)
-            for i, path in parse_matchfiles(check_sanity):
+            status = st.empty()
+            for i, path, stats in parse_matchfiles(check_sanity, incremental=not rebuild, workers=os.cpu_count(), profile=load_profiles()[profile.name]):
                 bar.progress(i)
+                status.caption(f"{stats.counters['files']} files read, {stats.get_files_per_second():.0f} files/s")
         placeholder.empty()
+    run_stats = load_run_stats(profile)
+    if run_stats is not None:
+        with st.expander(f"Last calculation ({run_stats['started'].replace('T', ' ')})"):
+            counters = run_stats["counters"]
+            display_metrics([
+                {"label": "Files read", "value": counters.get("files", 0), "help": f"{counters.get('unchanged', 0)} already processed files skipped"},
+                {"label": "Files per second", "value": run_stats["files_per_second"]},
+                {"label": "New matches", "value": counters.get("matches", 0), "help": f"{counters.get('rows', 0)} rows of players"},
+                {"label": "Duplicates", "value": counters.get("duplicates", 0)},
+                {"label": "Failed", "value": counters.get("errors", 0), "help": f"{counters.get('quarantined', 0)} files that failed before skipped"},
+            ])
+            st.write(f"Took {run_stats['seconds']:.1f}s.")
+            if len(run_stats["file_steps"]) > 0: # no files are read if nothing changed
+                st.write("Steps per file, as measured while reading the backups:")
+                st.dataframe(pd.DataFrame(run_stats["file_steps"]).T.drop(columns="histogram_ms"))
+            st.write("Steps of the whole calculation, in seconds:")
+            st.dataframe(pd.Series(run_stats["stages"], name="seconds"))
+            memory = run_stats["memory_mb"]
+            if "new_matches_parsed" in memory:
+                st.write(f"The new matches take up {memory['new_matches']} MB of memory, {memory['new_matches_parsed']} MB before their columns were compacted.")
+            if len(run_stats["errors"]) > 0:
+                st.write("Files that could not be read, by reason:")
+                st.dataframe(pd.Series(run_stats["errors"], name="files"))
+    quarantine = load_quarantine(profile)
+    if len(quarantine) > 0:
+        with st.expander(f"Rejected Matchfiles ({len(quarantine)})"):
+            st.write(
+                "These files could not be read, for example because they are from a quickplay match.",
+                "They are skipped when calculating the statistics, until they change or a new version of the app reads files differently.",
+            )
+            rejected = pd.DataFrame.from_dict(quarantine, orient="index")
+            st.dataframe(rejected[["reason", "stage", "quarantined"]].rename(index=os.path.basename))
+            reasons = st.multiselect("Retry files rejected because of...", rejected["reason"].unique())
+            if st.button("Retry", disabled = len(reasons) == 0):
+                with st.spinner("Reading files again..."):
+                    retry_quarantined(rejected.index[rejected["reason"].isin(reasons)], profile)
+                    ingest(load_profiles()[profile.name])
+                st.success(f"{len(quarantine) - len(load_quarantine(profile))} files could be read now.")
+
+    st.caption("Playing as a clan")
+    col0, col1 = st.columns(2)
+    with col0:
+        st.write(
+            "Every player can have their own profile with a separate matchfile, backups and statistics.",
+            "The Match Recorder records all profiles at once.",
+            "Matches played together are only counted once in the clan statistics.",
+        )
+    with col1:
+        new_profile = st.text_input("Name of the new profile")
+        if st.button("Add Profile", disabled = new_profile.strip() in ["", *profiles.keys()]):
+            try:
+                save_profile(new_profile.strip())
+            except AssertionError as e:
+                st.error(e)
+            else:
+                st.success(f"Added profile {new_profile.strip()}, select it at the top to set it up.")
 
 
-RESULTFILE = os.path.join(RESULT_DIR, "matches.pq")
-if not os.path.exists(RESULTFILE):
+def is_processed(profile):
+    return all([store_exists(profile.matches_dir), *[os.path.exists(path) for path in [profile.summary_file, profile.players_file, profile.identity_file]]])
+
+if not is_processed(profile):
     st.warning("No Match Data has been processed. Go to `Settings`.")
 else:
-    matches = pd.read_parquet(RESULTFILE).reset_index()
+    version = get_matches_version(profile.name)
+    matches = load_matches(version, profile.name)
+    summary = load_summary(version, profile.name)
+    my_id = load_my_id(version, profile.name)
 
     with total:
         # metrics
-        n_matches = int(matches["matchno"].nunique())
+        n_matches = len(summary)
         if n_matches > 2:
             trend_window = st.slider(
                 "Number of recent matches for trend",
@@ -152,14 +264,14 @@ else:
             )
         else:
             trend_window = 1
-        display_fighting_KPIs(matches, trend_window)
-        display_mmr_KPIs(matches, trend_window)
+        display_fighting_KPIs(summary, trend_window)
+        display_mmr_KPIs(matches, summary, my_id, trend_window)
 
         a, b = st.columns(2)
         with a:
             st.subheader("Match Results")
             st.write("This chart shows how your matches ended for you.")
-            st.plotly_chart(plot_match_endings(matches), use_container_width=True)
+            st.plotly_chart(plot_match_endings(summary), use_container_width=True)
         with b:
             st.subheader("Team Sizes")
             st.write(
@@ -167,7 +279,7 @@ else:
                 "Empty fields mean no such match was recorded.",
             )
             metric = st.selectbox("Display the ...", ["matches played", "extraction rate", "survival rate"])
-            st.pyplot(plot_team_sizes(matches, metric))
+            st.pyplot(plot_team_sizes(summary, metric))
             plt.close()
 
         # MMR history
@@ -190,7 +302,7 @@ else:
             "The color indicates whether you survived the Hunt.",
             "The shape shows the number of Hunters in your team.",
         )
-        fig = plot_mmr_hisotry(matches, xaxis, mmr_out)
+        fig = plot_mmr_hisotry(matches, summary, my_id, xaxis, mmr_out)
         st.plotly_chart(fig)
 
         st.subheader("Teammate Analysis")
@@ -201,7 +313,7 @@ else:
             "The amount of matches needed before a player shows up in this analysis can vary.",
             "The algorithm will try to set this requirement as low as possible, while making sure results can be calculated."
         )
-        target = st.selectbox("Analyze Teammates influence on...", ["extracting with a bounty", "surviving"])
+        target = st.selectbox("Analyze Teammates influence on...", list(SUCCESS_TARGETS.keys()))
         include_me = st.checkbox(
             "Include myself", 
             help = """
@@ -211,32 +323,42 @@ else:
                 For this reason (and some more mathematical ones) your personal effect will probably be very negative.
             """
         )
-        st.pyplot(effect_on_success_chance(matches, target, include_me))
+        effects, minimum_matches = load_teammate_effects(version, target, profile=profile.name)
+        st.pyplot(effect_on_success_chance(effects, load_profileid_map(version, profile.name), my_id, target, include_me, minimum_matches))
         plt.close()
 
+        clan = tuple(name for name, p in profiles.items() if is_processed(p))
+        if len(clan) > 1:
+            st.subheader("Clan")
+            st.write("Matches of all profiles, matches played together are only counted once.")
+            combined = load_combined_matches(get_combined_version(clan), clan)
+            recorded = combined.groupby("matchno")[["profile", "recorded_by"]].first()
+            columns = st.columns(2)
+            with columns[0]:
+                st.metric("Matches recorded", len(recorded))
+            with columns[1]:
+                st.metric("Played together", int((recorded["recorded_by"] > 1).sum()))
+            st.dataframe(recorded.groupby("profile").size().rename("matches first recorded").to_frame())
+
 
     with single:
         # match table
-        my_id = find_my_id(matches)
-        match_display_names = {f"{matchno+1}: {construct_match_name(subset, my_id)}": matchno for matchno, subset in matches.groupby("matchno")}
+        match_display_names = load_match_display_names(version, profile.name)
         selected_match = st.selectbox(
             label = "Select a Match",
             options = reversed(match_display_names.keys()),
         )
-        selection = matches.loc[matches["matchno"] == match_display_names[selected_match]]
+        selection = load_match(version, match_display_names[selected_match], profile.name)
         
         # single match KPIs
-        my_game = selection.loc[(matches["profileid"] == my_id)]
+        my_game = selection.loc[(selection["profileid"] == my_id)]
         mmr_in = my_game["mmr"].iloc[0]
+        match_summary = summary.set_index("matchno")
         try:
-            mmr_out = matches.loc[
-                (matches["matchno"] == match_display_names[selected_match] + 1) &
-                (matches["profileid"] == my_id),
-                "mmr"
-            ].iloc[0]
+            mmr_out = match_summary.loc[match_display_names[selected_match] + 1, "mmr"]
             mmr_out_estimated = False
-        except IndexError:
-            mmr_out = predict_mmr(matches)
+        except KeyError:
+            mmr_out = match_summary.loc[match_display_names[selected_match], "mmr_out_estimated"]
             mmr_out_estimated = True
         
         columns = st.columns(2)
@@ -276,3 +398,43 @@ else:
                     subset = ["bountyextracted"]
                 )
             )
+
+
+    with hunters:
+        # everyone you met
+        players = load_players(version, profile.name)
+        search = st.text_input("Search a Hunter", help = "Searches all names a Hunter has been seen with.")
+        found = players.loc[load_player_search_names(version, profile.name).str.contains(search.casefold(), regex=False)]
+        found = found.drop(my_id, errors="ignore").sort_values("encounters", ascending=False)
+        if len(found) == 0:
+            st.info("No Hunter found.")
+        else:
+            profileid = st.selectbox(
+                label = "Select a Hunter",
+                options = found.index[:100], # most often met first
+                format_func = lambda profileid: f"{players.at[profileid, 'name']} ({players.at[profileid, 'encounters']} matches)",
+            )
+            player = players.loc[profileid]
+            columns = st.columns(3)
+            with columns[0]:
+                st.metric(
+                    "Matches together",
+                    value = int(player["encounters"]),
+                    help = f"{player['as_teammate']}× as teammate, {player['as_enemy']}× as enemy",
+                )
+            with columns[1]:
+                st.metric(
+                    "Your K / D against them",
+                    value = f"{player['kills']} / {player['deaths']}",
+                )
+            with columns[2]:
+                st.metric(
+                    "Last seen",
+                    value = player["last_seen"].strftime("%Y-%m-%d"),
+                    help = f"First seen {player['first_seen'].strftime('%Y-%m-%d')}",
+                )
+            aliases = [alias for alias in player["aliases"] if alias != player["name"]]
+            if len(aliases) > 0:
+                st.write("Also known as:", ", ".join(aliases))
+            st.subheader("MMR History")
+            st.plotly_chart(plot_player_mmr_history(player), use_container_width=True)
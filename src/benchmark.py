@@ -0,0 +1,411 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from time import perf_counter
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg") # no display needed
+from matplotlib import pyplot as plt
+from watcher import TIMESTAMP_FORMAT
+from extract import main as extract_matches
+from extract import read_match, read_attributes, annotate_matches, convert_player_columns, load_identity, load_run_stats, load_quarantine, load_manifest, sanity_check, MatchBatch
+from profiles import Profile
+import store
+from match_utils import get_my_matches, get_teammate_matrix, fit_teammate_effects, update_elo_scores, MMR_BRACKETS
+from kpis import get_fighting_KPIs, get_mmr_KPIs, get_mmr_taken_KPIs
+from plots import plot_mmr_hisotry, plot_team_sizes, effect_on_success_chance
+
+
+PLAYER_COUNTERS = [
+    "bountyextracted",
+    "bountypickedup",
+    "downedbyme",
+    "downedbyteammate",
+    "downedme",
+    "downedteammate",
+    "killedbyme",
+    "killedbyteammate",
+    "killedme",
+    "killedteammate",
+]
+PLAYER_FLAGS = [
+    "hadWellspring",
+    "hadbounty",
+    "ispartner",
+    "issoulsurvivor",
+    "proximity",
+    "proximitytome",
+    "proximitytoteammate",
+    "skillbased",
+    "teamextraction",
+]
+MY_ID = "1000"
+LOBBY_SHAPES = ["uniform", "mixed", "solos", "duos", "trios"]
+BACKENDS = ["xmltodict", "streaming"]
+SIZES = [100, 10000]
+REPORT_FILE = os.path.join("data", "reports", "benchmark.json")
+
+
+def generate_backups(directory, n_matches, seed=0, n_other_attributes=500, shape="uniform"):
+    # writes synthetic attributes.xml backups named like the ones of watcher.FileBackupper
+    rng = random.Random(seed)
+    friends = [str(2000 + i) for i in range(8)]
+    strangers = [str(10000 + i) for i in range(max(100, n_matches))]
+    start = datetime(2022, 8, 1)
+    for i in range(n_matches):
+        timestamp = (start + timedelta(minutes=45 * i)).strftime(TIMESTAMP_FORMAT)
+        xml = generate_attributes_xml(rng, friends, strangers, n_other_attributes, shape)
+        with open(os.path.join(directory, f"attributes_{timestamp}.xml"), "w", encoding="utf-8") as outfile:
+            outfile.write(xml)
+    return directory
+
+def get_team_sizes(rng, shape="uniform"):
+    # number of hunters per team, own team first, at most 12 hunters per lobby
+    match shape:
+        case "uniform": # all teams of the same size
+            team_size = rng.choice([1, 2, 3])
+        case "solos" | "duos" | "trios":
+            team_size = {"solos": 1, "duos": 2, "trios": 3}[shape]
+        case "mixed": # teams of any size in the same lobby
+            sizes = [rng.choice([1, 2, 3]), rng.choice([1, 2, 3])]
+            n_players = rng.randint(6, 12)
+            while sum(sizes) < n_players:
+                sizes.append(rng.choice([size for size in [1, 2, 3] if sum(sizes) + size <= 12]))
+            return sizes
+        case _:
+            raise ValueError(f"Unknown lobby shape: {shape}")
+    return [team_size] * rng.randint(max(2, 6 // team_size), 12 // team_size)
+
+def generate_attributes_xml(rng, friends, strangers, n_other_attributes=500, shape="uniform"):
+    team_sizes = get_team_sizes(rng, shape)
+    n_teams = len(team_sizes)
+    my_team = [MY_ID] + rng.sample(friends, team_sizes[0] - 1)
+    enemies = iter(rng.sample(strangers, sum(team_sizes[1:])))
+    attributes = [(f"UI_Setting_{i}", str(rng.randint(0, 100))) for i in range(n_other_attributes)]
+    attributes += [
+        ("MissionBagIsQuickPlay", "false"),
+        ("MissionBagIsHunterDead", rng.choice(["true", "false"])),
+        ("MissionBagNumTeams", str(n_teams)),
+        ("MissionBagNumAccolades", "2"),
+        ("MissionBagNumEntries", "1"),
+    ]
+    bounty_team = rng.randrange(n_teams) if rng.random() < 0.6 else None
+    for team in range(n_teams):
+        ownteam = team == 0
+        profileids = my_team if ownteam else [next(enemies) for _ in range(team_sizes[team])]
+        attributes += [
+            (f"MissionBagTeam_{team}", "1"),
+            (f"MissionBagTeam_{team}_handicap", "0"),
+            (f"MissionBagTeam_{team}_isinvite", "false"),
+            (f"MissionBagTeam_{team}_mmr", str(rng.randint(1500, 4000))),
+            (f"MissionBagTeam_{team}_numplayers", str(team_sizes[team])),
+            (f"MissionBagTeam_{team}_ownteam", str(ownteam).lower()),
+        ]
+        for player, profileid in enumerate(profileids):
+            key = f"MissionBagPlayer_{team}_{player}"
+            attributes += [
+                (f"{key}_blood_line_name", f"Hunter {profileid}"),
+                (f"{key}_profileid", profileid),
+                (f"{key}_mmr", str(rng.randint(1500, 4000))),
+            ]
+            for counter in PLAYER_COUNTERS:
+                if counter.startswith("bounty"):
+                    value = int(team == bounty_team and player == 0)
+                else:
+                    value = int(rng.random() < 0.1)
+                attributes.append((f"{key}_{counter}", str(value)))
+            for flag in PLAYER_FLAGS:
+                value = (ownteam and player > 0) if flag == "ispartner" else rng.random() < 0.2
+                attributes.append((f"{key}_{flag}", str(value).lower()))
+            attributes.append((f"{key}_tooltipkilledbyme", ""))
+    for accolade in range(2):
+        attributes += [
+            (f"MissionAccoladeEntry_{accolade}", "1"),
+            (f"MissionAccoladeEntry_{accolade}_header", "@ui_accolade"),
+            (f"MissionAccoladeEntry_{accolade}_iconPath", "accolade.dds"),
+            (f"MissionAccoladeEntry_{accolade}_xp", str(rng.randint(0, 500))),
+        ]
+    attributes += [("MissionBagEntry_0_amount", "1"), ("MissionBagEntry_0_category", "accolade_found_clue")]
+    rng.shuffle(attributes)
+    lines = "\n".join(f'\t<Attr name="{name}" value="{value}"/>' for name, value in attributes)
+    return f'<Attributes Version="37">\n{lines}\n</Attributes>\n'
+
+
+def parse_backups(directory):
+    matches = []
+    for matchno, filename in enumerate(sorted(os.listdir(directory))):
+        with open(os.path.join(directory, filename), "r", errors="ignore", encoding="utf-8") as infile:
+            match = read_match(infile.read())
+        timestamp = os.path.splitext(filename)[0].split("_")[-1]
+        constants = {"matchno": matchno, "datetime_match_ended": datetime.strptime(timestamp, TIMESTAMP_FORMAT)}
+        matches.append((match, constants))
+    return matches
+
+def accumulate_by_concat(matches):
+    # how extract.main used to collect matches, one frame per match
+    frame = pd.DataFrame()
+    for match, constants in matches:
+        data = pd.DataFrame.from_records(match).set_index(["teamno", "playerno"])
+        for key, value in constants.items():
+            data[key] = value
+        frame = pd.concat([frame, data.reset_index()], ignore_index=True)
+    return convert_player_columns(frame) # used to be done for every value while parsing
+
+def accumulate_by_batch(matches):
+    batch = MatchBatch()
+    for match, constants in matches:
+        batch.add(match, **constants)
+    return batch.to_frame()
+
+def mmr_taken_by_loop(matches):
+    # how plots.display_mmr_KPIs used to go through every victim
+    def get_mmr_bracket(mmr):
+        for bracket in sorted(MMR_BRACKETS.keys()):
+            if MMR_BRACKETS[bracket] > mmr:
+                return bracket
+    matches = matches.set_index("matchno")
+    mine = get_my_matches(matches)["mmr"]
+    mine.name = "my_mmr"
+    matches = matches.join(mine)
+    matches["shotbyme"] = matches[["downedbyme", "killedbyme"]].sum(axis=1)
+    matches["shotme"] = matches[["downedme", "killedme",]].sum(axis=1)
+    matches = matches.loc[(matches["shotbyme"] + matches["shotme"]) > 0]
+    total_mmr_taken = 0
+    max_mmr_taken = 0
+    max_mmr_taken_victim = ""
+    ranks_taken = 0
+    deranked = set()
+    for (matchno, profileid), row in matches.groupby(["matchno", "profileid"], observed=True):
+        mmr_taken = update_elo_scores(row["my_mmr"], row["mmr"], 1, return_updated=False) * row["shotbyme"]
+        mmr_taken = mmr_taken.iloc[0]
+        if mmr_taken > 0:
+            mmr_lost = update_elo_scores(row["my_mmr"], row["mmr"], 0, return_updated=False) * row["shotme"]
+            mmr_taken += mmr_lost.iloc[0]
+        if mmr_taken > 0:
+            total_mmr_taken += mmr_taken
+            if mmr_taken > max_mmr_taken:
+                max_mmr_taken = mmr_taken
+                max_mmr_taken_victim = row["blood_line_name"].iloc[0] + f" (#{matchno+1})"
+            rank_before = get_mmr_bracket(row["mmr"].iloc[0])
+            rank_after = get_mmr_bracket(row["mmr"].iloc[0] - mmr_taken)
+            if rank_before > rank_after:
+                ranks_taken += rank_before - rank_after
+                deranked.add(row["blood_line_name"].iloc[0] + f" (#{matchno+1}) {rank_before}↘{rank_after}")
+    return total_mmr_taken, max_mmr_taken, max_mmr_taken_victim, ranks_taken, deranked
+
+def sanity_check_by_match(matches):
+    # how extract.sanity_check used to run, once per match in the workers and raising on the first issue
+    issues = {}
+    for matchno, data in matches.groupby("matchno"):
+        try:
+            assert data["profileid"].nunique() <= 12, "Too many players."
+            assert all(data.groupby("profileid")["teamno"].nunique() == 1), "Same player in multiple teams."
+            assert all(data.groupby("teamno")["playerno"].nunique() == data.groupby("teamno")["profileid"].nunique()), "Player-indicies don't match team size."
+            largest_teamsize = data.groupby("teamno")["profileid"].nunique().max()
+            assert largest_teamsize <= 3, "Team too large."
+            assert data["ispartner"].sum() <= largest_teamsize, "Too many teammates."
+            assert data["bountyextracted"].dropna().astype(int).sum() <= 4, "Too many extracted bounties."
+        except AssertionError as e:
+            issues[matchno] = str(e)
+    return issues
+
+def read_files(directory, func, n_files=1000):
+    filenames = sorted(os.listdir(directory))[:n_files]
+    for filename in filenames:
+        with open(os.path.join(directory, filename), "r", errors="ignore", encoding="utf-8") as infile:
+            func(infile.read())
+    return len(filenames)
+
+def timed(func, *args):
+    start = perf_counter()
+    result = func(*args)
+    return result, perf_counter() - start
+
+def measure(stages, name, func, *args):
+    # time and peak memory allocated by python in this process, extraction workers are not traced
+    memory_before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    result, duration = timed(func, *args)
+    peak = tracemalloc.get_traced_memory()[1] - memory_before
+    stages[name] = {"seconds": round(duration, 4), "peak_memory_mb": round(peak / 2**20, 1)}
+    print(f"{name}: {duration:.3f}s" + (f", peak memory {peak / 2**20:.1f}MB" if tracemalloc.is_tracing() else ""))
+    return result
+
+
+def benchmark_pipeline(directory, workers=1):
+    # every stage of the app, from reading the backups to the charts
+    stages = {}
+    for backend in BACKENDS:
+        n = measure(stages, f"read_attributes[{backend}]", read_files, directory, lambda xml: read_attributes(xml, backend))
+        stages[f"read_attributes[{backend}]"]["ms_per_file"] = round(stages[f"read_attributes[{backend}]"]["seconds"] / n * 1000, 3)
+    n = measure(stages, "read_match", read_files, directory, read_match)
+    stages["read_match"]["ms_per_file"] = round(stages["read_match"]["seconds"] / n * 1000, 3)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="hunt-benchmark-") as root:
+        os.chdir(root) # processed matches and the parse cache start out empty
+        try:
+            profile = Profile(backup_dir=directory)
+            measure(stages, "extract", extract_all, profile, workers)
+            stages["extract"]["frame_memory_mb"] = load_run_stats(profile)["memory_mb"]
+            measure(stages, "extract[nothing new]", extract_all, profile, workers)
+            matches, summary, my_id = measure(stages, "load", load_results, profile)
+            measure(stages, "fighting_KPIs", get_fighting_KPIs, summary)
+            measure(stages, "mmr_KPIs", get_mmr_KPIs, matches, summary, my_id)
+            measure(stages, "plot_mmr_history", plot_mmr_hisotry, matches, summary, my_id, "matchno", True)
+            measure(stages, "plot_team_sizes", plot_team_sizes, summary)
+            plt.close("all")
+            X, matchnos, profileids = measure(stages, "teammate_matrix", get_teammate_matrix, matches)
+            y = summary.set_index("matchno").loc[matchnos, "bountyextracted"].to_numpy(dtype=float)
+            effects, minimum_matches = measure(stages, "teammate_effects", fit_teammate_effects, X, y, profileids)
+            measure(stages, "effect_on_success_chance", effect_on_success_chance, effects, {}, my_id, "extracting with a bounty", False, minimum_matches)
+            plt.close("all")
+        finally:
+            os.chdir(cwd)
+    return stages
+
+def extract_all(profile, workers):
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull): # one line per file
+        for _ in extract_matches(check_sanity=True, incremental=True, workers=workers, profile=profile):
+            pass
+
+def load_results(profile):
+    return store.read_matches(profile.matches_dir), store.read_table(profile.summary_file), load_identity(profile)["profileid"]
+
+def compare_to_baseline(report, baseline, tolerance=0.2):
+    # stages that got slower than in an earlier report of the same sizes and shapes
+    slower = []
+    for run in report["runs"]:
+        for old in baseline["runs"]:
+            if (old["matches"], old["shape"]) != (run["matches"], run["shape"]):
+                continue
+            for name, stage in run["stages"].items():
+                before = old["stages"].get(name, {}).get("seconds")
+                if before is not None and stage["seconds"] > before * (1 + tolerance) + 0.01:
+                    slower.append(f"{run['matches']} {run['shape']} matches, {name}: {before:.3f}s -> {stage['seconds']:.3f}s")
+    return slower
+
+
+def compare_optimizations(directory):
+    # earlier implementations against the current ones, same results but faster
+    matches, duration = timed(parse_backups, directory)
+    print(f"Parsed {len(matches)} backups: {duration:.1f}s")
+    by_concat, duration_concat = timed(accumulate_by_concat, matches)
+    print(f"Accumulating with pd.concat: {duration_concat:.2f}s")
+    by_batch, duration_batch = timed(accumulate_by_batch, matches)
+    print(f"Accumulating with MatchBatch: {duration_batch:.2f}s")
+    pd.testing.assert_frame_equal(by_concat, by_batch, check_dtype=False)
+    print(f"Identical results, speedup {duration_concat / duration_batch:.1f}×")
+    by_batch = annotate_matches(by_batch)
+    by_loop, duration_loop = timed(mmr_taken_by_loop, by_batch)
+    print(f"MMR taken by looping over victims: {duration_loop:.2f}s")
+    vectorized, duration_vectorized = timed(get_mmr_taken_KPIs, by_batch)
+    print(f"MMR taken vectorized: {duration_vectorized:.3f}s")
+    assert by_loop == vectorized
+    print(f"Identical results, speedup {duration_loop / duration_vectorized:.1f}×")
+    by_match, duration_by_match = timed(sanity_check_by_match, by_batch)
+    print(f"Sanity check per match: {duration_by_match:.2f}s")
+    batched, duration_batched = timed(sanity_check, by_batch)
+    print(f"Sanity check of all matches at once: {duration_batched:.3f}s")
+    assert by_match == batched.dropna().to_dict()
+    print(f"Identical results, speedup {duration_by_match / duration_batched:.1f}×")
+    check_dropped_matches()
+    print("Invalid and implausible matches of one run are quarantined, the others numbered without gaps")
+
+def check_dropped_matches(n_matches=12):
+    # a match with an invalid value and a later one failing the sanity check, extracted in the same run
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="hunt-benchmark-") as root:
+        os.chdir(root)
+        try:
+            backups = os.path.join(root, "backups")
+            os.makedirs(backups)
+            generate_backups(backups, n_matches, n_other_attributes=0)
+            files = sorted(os.listdir(backups))
+            invalid, implausible = files[2], files[7]
+            replace_in_file(os.path.join(backups, invalid), '_killedbyme" value="0"', '_killedbyme" value="abc"', 1)
+            replace_in_file(os.path.join(backups, implausible), '_bountyextracted" value="0"', '_bountyextracted" value="1"')
+            profile = Profile(backup_dir=backups)
+            extract_all(profile, 1)
+            quarantine = {os.path.basename(path): entry["reason"] for path, entry in load_quarantine(profile).items()}
+            assert quarantine == {invalid: "Invalid value for killedbyme.", implausible: "Too many extracted bounties."}, quarantine
+            matchnos = {os.path.basename(path): entry["matchno"] for path, entry in load_manifest(profile)["files"].items()}
+            expected = {filename: matchno for matchno, filename in enumerate(f for f in files if f not in quarantine)}
+            assert {filename: matchno for filename, matchno in matchnos.items() if matchno is not None} == expected
+            assert store.read_matches(profile.matches_dir, ["matchno"])["matchno"].unique().tolist() == list(range(n_matches - 2))
+        finally:
+            os.chdir(cwd)
+
+def replace_in_file(path, old, new, count=-1):
+    with open(path, "r", encoding="utf-8") as infile:
+        content = infile.read()
+    with open(path, "w", encoding="utf-8") as outfile:
+        outfile.write(content.replace(old, new, count))
+
+
+def main(sizes=SIZES, shapes=["uniform"], directory=None, out=REPORT_FILE, workers=1, memory=True, baseline=None, compare=False, n_other_attributes=500):
+    temporary = directory is None # generated backups are only kept in a given directory
+    directory = os.path.abspath(directory or tempfile.mkdtemp(prefix="hunt-benchmark-"))
+    out = os.path.abspath(out)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+        "memory_traced": memory,
+        "runs": [],
+    }
+    try:
+        for shape in shapes:
+            for n_matches in sizes:
+                backups = os.path.join(directory, f"{shape}-{n_matches}")
+                os.makedirs(backups, exist_ok=True)
+                if len(os.listdir(backups)) != n_matches:
+                    _, duration = timed(generate_backups, backups, n_matches, 0, n_other_attributes, shape)
+                    print(f"Generated {n_matches} backups in {backups} ({duration:.1f}s)")
+                print(f"Benchmarking {n_matches} matches with {shape} lobbies")
+                if memory:
+                    tracemalloc.start()
+                try:
+                    stages = benchmark_pipeline(backups, workers)
+                finally:
+                    tracemalloc.stop()
+                report["runs"].append({"matches": n_matches, "shape": shape, "stages": stages})
+                if compare:
+                    compare_optimizations(backups)
+    finally:
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"Report written to {out}")
+    if baseline is not None:
+        with open(baseline, "r") as infile:
+            slower = compare_to_baseline(report, json.load(infile))
+        for regression in slower:
+            print("Slower than baseline:", regression)
+        if len(slower) > 0:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the app on synthetic matchfiles.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Numbers of synthetic backups, e.g. 100 10000 100000.")
+    parser.add_argument("--shapes", nargs="+", choices=LOBBY_SHAPES, default=["uniform"], help="Team sizes in the generated lobbies.")
+    parser.add_argument("--dir", default=None, help="Directory for the backups. Existing backups are reused.")
+    parser.add_argument("--out", default=REPORT_FILE, help="Where to write the report as json.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes reading backups during extraction.")
+    parser.add_argument("--other-attributes", type=int, default=500, help="Attributes unrelated to matches per file, real matchfiles have thousands.")
+    parser.add_argument("--no-memory", action="store_true", help="Only measure time, tracing memory slows down every stage.")
+    parser.add_argument("--baseline", default=None, help="Earlier report, exits with an error if a stage got more than 20%% slower.")
+    parser.add_argument("--compare", action="store_true", help="Also compare earlier implementations, slow for many matches.")
+    args = parser.parse_args()
+    main(args.sizes, args.shapes, args.dir, args.out, args.workers, not args.no_memory, args.baseline, args.compare, args.other_attributes)
@@ -0,0 +1,70 @@
+import os
+import pickle
+from glob import glob
+from uuid import uuid4
+
+
+CACHE_DIR = os.path.join("data", "cache")
+CACHE_SIZE = 256 * 2**20 # in bytes
+
+
+class ParseCache:
+    # stores parsed objects on disk under the hash of the content they were parsed from,
+    # least recently used entries are deleted once the cache grows beyond max_size
+    def __init__(self, directory=CACHE_DIR, max_size=CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.size = None # bytes on disk, counted on first write
+
+    def get(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as infile:
+                value = pickle.load(infile)
+            os.utime(path) # mark as recently used
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def set(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.get_path(key)
+        temp_path = f"{path}.{uuid4().hex}.tmp"
+        with open(temp_path, "wb") as outfile:
+            pickle.dump(value, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path) # never leave half written entries
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.get_entries())
+        else:
+            self.size += os.path.getsize(path)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        self.size = 0
+        for _, size, entry in sorted(self.get_entries(), reverse=True): # most recently used first
+            if self.size + size > self.max_size * 0.9: # leave some room to avoid evicting on every write
+                try:
+                    os.remove(entry)
+                except FileNotFoundError: # already removed by another process
+                    pass
+            else:
+                self.size += size
+
+    def clear(self):
+        for _, _, entry in self.get_entries():
+            os.remove(entry)
+        self.size = 0
+
+    def get_entries(self):
+        entries = []
+        for entry in glob(os.path.join(self.directory, "*.pkl")):
+            try:
+                stat = os.stat(entry)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        return entries
+
+    def get_path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
@@ -0,0 +1,116 @@
+from functools import lru_cache
+import pandas as pd
+from extract import load_identity, load_match_hashes
+from profiles import get_profile, DEFAULT_PROFILE
+from store import read_matches, read_table, get_version, compact
+from match_utils import construct_match_name, get_teammate_matrix, fit_teammate_effects, SUCCESS_TARGETS
+
+# cached per version of the processed matches, so reruns of the app don't load or derive anything again
+# the version changes whenever extraction writes new matches, returned frames must not be modified
+# modules stay imported between reruns, so the caches live as long as the app and only keep the newest version
+# every loader takes the name of the profile whose matches are loaded, switching profiles loads them again
+
+MATCH_COLUMNS = [ # all the views of the app need, attributes unrelated to them are not loaded
+    "matchno",
+    "teamno",
+    "playerno",
+    "profileid",
+    "blood_line_name",
+    "mmr",
+    "bracket",
+    "bountyextracted",
+    "downedbyme",
+    "downedbyteammate",
+    "downedme",
+    "downedteammate",
+    "killedbyme",
+    "killedbyteammate",
+    "killedme",
+    "killedteammate",
+    "survival",
+    "mmr_team",
+    "numplayers",
+    "ownteam",
+    "datetime_match_ended",
+]
+COMBINED_COLUMNS = ["matchno", "teamno", "playerno", "datetime_match_ended"]
+
+def get_matches_version(profile=DEFAULT_PROFILE):
+    profile = get_profile(profile)
+    return (
+        get_version(profile.matches_dir),
+        get_version(profile.summary_file),
+        get_version(profile.players_file),
+        get_version(profile.identity_file),
+        get_version(profile.manifest_file),
+    )
+
+@lru_cache(maxsize=1)
+def load_matches(version, profile=DEFAULT_PROFILE):
+    return read_matches(get_profile(profile).matches_dir, MATCH_COLUMNS)
+
+@lru_cache(maxsize=1)
+def load_summary(version, profile=DEFAULT_PROFILE):
+    return read_table(get_profile(profile).summary_file)
+
+@lru_cache(maxsize=1)
+def load_my_id(version, profile=DEFAULT_PROFILE):
+    return load_identity(get_profile(profile))["profileid"]
+
+@lru_cache(maxsize=1)
+def load_match_display_names(version, profile=DEFAULT_PROFILE):
+    my_id = load_my_id(version, profile)
+    return {
+        f"{matchno+1}: {construct_match_name(subset, my_id)}": matchno
+        for matchno, subset in load_matches(version, profile).groupby("matchno")
+    }
+
+def load_match(version, matchno, profile=DEFAULT_PROFILE):
+    matches = load_matches(version, profile) # sorted by matchno
+    start, stop = matches["matchno"].searchsorted([matchno, matchno + 1])
+    return matches.iloc[start:stop]
+
+@lru_cache(maxsize=1)
+def load_players(version, profile=DEFAULT_PROFILE):
+    return read_table(get_profile(profile).players_file).set_index("profileid")
+
+@lru_cache(maxsize=1)
+def load_player_search_names(version, profile=DEFAULT_PROFILE):
+    return load_players(version, profile)["aliases"].map(" / ".join).str.casefold()
+
+@lru_cache(maxsize=1)
+def load_profileid_map(version, profile=DEFAULT_PROFILE):
+    return load_players(version, profile)["name"].to_dict()
+
+@lru_cache(maxsize=1)
+def load_teammate_matrix(version, profile=DEFAULT_PROFILE):
+    return get_teammate_matrix(load_matches(version, profile))
+
+@lru_cache(maxsize=8) # every target and threshold that has been looked at
+def load_teammate_effects(version, target, minimum_matches=3, profile=DEFAULT_PROFILE):
+    X, matchnos, profileids = load_teammate_matrix(version, profile)
+    y = load_summary(version, profile).set_index("matchno").loc[matchnos, SUCCESS_TARGETS[target]].to_numpy(dtype=float)
+    return fit_teammate_effects(X, y, profileids, minimum_matches)
+
+
+def get_combined_version(profiles):
+    return tuple(get_matches_version(profile) for profile in profiles)
+
+@lru_cache(maxsize=1)
+def load_combined_matches(version, profiles):
+    # matches of all given profiles, a match recorded by several of them is only kept once
+    # rows are those of the profile that recorded it first, matchnos are renumbered across profiles
+    combined = []
+    for profile in profiles:
+        matches = read_matches(get_profile(profile).matches_dir, COMBINED_COLUMNS)
+        combined.append(matches.assign(
+            profile = profile,
+            profile_matchno = matches["matchno"],
+            match_hash = matches["matchno"].map(load_match_hashes(get_profile(profile))),
+        ))
+    combined = pd.concat(combined, ignore_index=True).sort_values(["datetime_match_ended", "profile", "matchno"], kind="stable")
+    by_match = combined.groupby("match_hash", sort=False)["profile"]
+    combined = combined.assign(recorded_by = by_match.transform("nunique"))
+    combined = combined.loc[combined["profile"] == by_match.transform("first")]
+    combined["matchno"] = pd.factorize(combined["match_hash"])[0]
+    return compact(combined).reset_index(drop=True)
@@ -1,143 +1,627 @@
 import xmltodict
+from xml.parsers import expat
 import pandas as pd
 import hashlib
 from glob import glob
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from contextlib import contextmanager
+from time import time, sleep
 import os
-from watcher import TIMESTAMP_FORMAT, BACKUP_DIR
-from streamlit import cache
-import pickle
+import threading
+from watcher import TIMESTAMP_FORMAT
+from cache import ParseCache, CACHE_DIR
+from profiles import get_profile, load_profiles
+from instrumentation import RunStats, Stopwatch
+import store
+import json
 
-RESULT_DIR = os.path.join("data", "processed")
+LOCK_TIMEOUT = 600 # in seconds
+PARSER_VERSION = 3 # increase whenever parsing changes the extracted data, forces a rebuild
+MATCH_ATTRIBUTE_PREFIXES = ("MissionBag", "MissionAccoladeEntry")
+PARSE_CACHE = ParseCache(os.path.join(CACHE_DIR, f"parser-v{PARSER_VERSION}"))
 
 
-def main(check_sanity=True):
-    matches = pd.DataFrame()
-    files = sorted([filepath for filepath in glob(os.path.join(BACKUP_DIR, "*.xml"))])
-    match_history = set()
-    for i, path in enumerate(files):
-        yield (i/len(files), path)
-        with open(path, "r", errors="ignore", encoding="utf-8") as infile:
-            xml = infile.read()
-        try:
-            data = parse_xml(xml)
-            match_hash = create_match_hash(data)
-            if match_hash in match_history:
-                continue
-            if check_sanity:
-                sanity_check(data)
-        except Exception as e:
-            print(f"Could not parse match info from file {path}: {e}")
+def main(check_sanity=True, incremental=True, workers=1, profile=None):
+    profile = profile or get_profile()
+    # the app and the match recorder might both extract at the same time
+    with lock_results(profile):
+        yield from extract_matches(check_sanity, incremental, workers, profile)
+
+def ingest(profile=None):
+    # append new backups to the processed matches, with the settings of the last extraction
+    profile = profile or get_profile()
+    manifest = load_manifest(profile)
+    check_sanity = manifest["settings"]["check_sanity"] if manifest is not None else True
+    for _ in main(check_sanity, incremental=True, profile=profile):
+        pass
+
+def extract_profiles(profiles, check_sanity=True, incremental=True, workers=1):
+    # every profile has its own store and lock, so they are extracted side by side
+    if workers > 1 and len(profiles) > 1:
+        args = (profiles, repeat(check_sanity), repeat(incremental))
+        with ProcessPoolExecutor(min(workers, len(profiles))) as executor:
+            list(executor.map(extract_profile, *args))
+    else:
+        for profile in profiles:
+            extract_profile(profile, check_sanity, incremental, workers)
+
+def extract_profile(profile, check_sanity=True, incremental=True, workers=1):
+    for _ in main(check_sanity, incremental, workers, profile):
+        pass
+    print(f"Extracted matches of profile {profile.name}.")
+
+def extract_matches(check_sanity=True, incremental=True, workers=1, profile=None):
+    # progress events are the share of files done, the file read next and the stats of the run so far
+    profile = profile or get_profile()
+    stats = RunStats()
+    with stats.stage("scan"):
+        files = sorted([filepath for filepath in glob(os.path.join(profile.backup_dir, "*.xml"))])
+        manifest = load_manifest(profile) if incremental else None
+        settings = {"parser_version": PARSER_VERSION, "check_sanity": check_sanity}
+        if manifest is None or manifest.get("settings") != settings or not store.exists(profile.matches_dir):
+            manifest = {"settings": settings, "files": {}}
+        pending = get_pending_files(files, manifest)
+        if pending is None: # known files changed or vanished, matchnos can not be kept stable
+            manifest = {"settings": settings, "files": {}}
+            pending = [(path, *stat_file(path)) for path in files]
+        quarantine = load_quarantine(profile)
+        rejected = {path for path, size, mtime in pending if is_quarantined(quarantine.get(path), size, mtime, check_sanity)}
+    stats.count("unchanged", len(files) - len(pending))
+    match_history = {entry["match_hash"] for entry in manifest["files"].values() if entry["matchno"] is not None}
+    matches = MatchBatch()
+    new_entries = {} # by matchno
+    results = read_backups([path for path, _, _ in pending if path not in rejected], get_xml_backend(), workers)
+    for i, (path, size, mtime) in enumerate(pending):
+        yield (i/len(pending), path, stats)
+        if path in rejected: # failed before, no need to read it again
+            stats.count("quarantined")
+            manifest["files"][path] = {"size": size, "mtime": mtime, "hash": quarantine[path]["hash"], "matchno": None, "match_hash": None}
+            continue
+        # results arrive in order of the files, so matchnos are assigned just like when reading one by one
+        with stats.stage("read_backups"):
+            content_hash, match, match_hash, error, laps = next(results)
+        stats.add_file(laps)
+        entry = {"size": size, "mtime": mtime, "hash": content_hash, "matchno": None, "match_hash": match_hash}
+        manifest["files"][path] = entry
+        if match_hash is not None and match_hash in match_history:
+            stats.count("duplicates")
+            continue
+        if error is not None:
+            stats.add_error(error["reason"])
+            quarantine[path] = get_quarantine_entry(entry, "parse", error["reason"])
+            print(f"Could not parse match info from file {path}: {error['reason']}")
         else:
+            quarantine.pop(path, None)
             matchno = len(match_history)
-            data["matchno"] = matchno
+            entry["matchno"] = matchno
+            new_entries[matchno] = path, entry
             match_history.add(match_hash)
             # read timestamp from filename
             timestamp = os.path.splitext(os.path.basename(path))[0].split("_")[-1]
-            data["datetime_match_ended"] = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
-            matches = pd.concat([matches, data.reset_index()], ignore_index=True)
+            with stats.stage("collect"):
+                matches.add(
+                    match,
+                    matchno = matchno,
+                    datetime_match_ended = datetime.strptime(timestamp, TIMESTAMP_FORMAT),
+                )
+            stats.count("matches")
             print(f"Successfully extracted matchdata from file: {path}")
     # finish and save
-    matches = matches.set_index(["matchno", "teamno", "playerno"])
-    matches.to_parquet(os.path.join(RESULT_DIR, "matches.pq"))
+    append = len(manifest["files"]) > len(pending) # to already processed matches
+    new_matches = None
+    if len(matches) > 0:
+        with stats.stage("build_frame"):
+            new_matches = matches.to_frame()
+            new_matches = drop_matches(new_matches, find_invalid_values(new_matches), "parse", new_entries, quarantine, stats)
+        if check_sanity:
+            with stats.stage("sanity_check"):
+                new_matches = drop_matches(new_matches, sanity_check(new_matches), "sanity_check", new_entries, quarantine, stats)
+    if new_matches is not None and len(new_matches) > 0:
+        stats.add_memory("new_matches_parsed", new_matches)
+        with stats.stage("build_frame"):
+            new_matches = store.compact(annotate_matches(new_matches))
+        stats.count("rows", len(new_matches))
+        stats.add_memory("new_matches", new_matches)
+        with stats.stage("write_matches"):
+            store.write_matches(new_matches, profile.matches_dir, append)
+        with stats.stage("write_players"):
+            write_players(new_matches, append, profile)
+    elif not append:
+        store.clear(profile.matches_dir)
+        if os.path.exists(profile.players_file):
+            os.remove(profile.players_file)
+    with stats.stage("identify"):
+        my_id = update_identity(new_matches, append, profile)
+    with stats.stage("write_summary"):
+        write_summary(my_id, profile)
+    with stats.stage("write_manifest"):
+        save_quarantine({path: entry for path, entry in quarantine.items() if path in manifest["files"]}, profile)
+        save_manifest(manifest, profile)
+    save_run_stats(stats, profile)
 
-def parse_xml(xml):
-    data = parse_xml_cached(xml)
-    # clone object since st.cache does not like it when cached returned objects are mutated later
-    data = pickle.loads(pickle.dumps(data)) 
-    return data 
+def drop_matches(matches, issues, stage, new_entries, quarantine, stats):
+    # matches with an issue are quarantined, the remaining ones are numbered without gaps
+    issues = issues.dropna()
+    if len(issues) == 0:
+        return matches
+    first_matchno = min(new_entries)
+    for matchno, reason in issues.items():
+        path, entry = new_entries.pop(matchno)
+        entry["matchno"] = None
+        quarantine[path] = get_quarantine_entry(entry, stage, reason)
+        stats.add_error(reason)
+        print(f"Could not use match info from file {path}: {reason}")
+    stats.count("matches", -len(issues))
+    renumbered = {matchno: first_matchno + i for i, matchno in enumerate(sorted(new_entries))}
+    for matchno, (_, entry) in new_entries.items():
+        entry["matchno"] = renumbered[matchno]
+    # keyed by the new numbers, so later checks find the right files
+    entries = {renumbered[matchno]: value for matchno, value in new_entries.items()}
+    new_entries.clear()
+    new_entries.update(entries)
+    matches = matches.loc[~matches["matchno"].isin(issues.index)]
+    return matches.assign(matchno = matches["matchno"].map(renumbered)).reset_index(drop=True)
 
-@cache(persist=True, show_spinner=False)
-def parse_xml_cached(xml):
-    data = xmltodict.parse(xml)
-    # cleanup names and transform to usable dict
-    data = {x["@name"]: x["@value"] for x in data["Attributes"]["Attr"]}
+def get_quarantine_entry(entry, stage, reason):
+    return {
+        "size": entry["size"],
+        "mtime": entry["mtime"],
+        "hash": entry["hash"],
+        "stage": stage,
+        "reason": reason,
+        "parser_version": PARSER_VERSION,
+        "quarantined": datetime.now().isoformat(timespec="seconds"),
+    }
+
+def annotate_matches(matches):
+    from match_utils import get_mmr_bracket
+    return matches.assign(bracket = get_mmr_bracket(matches["mmr"]))
+
+def write_players(new_matches, append, profile):
+    # the index of all players met is only updated with the new matches
+    from players import summarize_players, merge_players
+    if not append:
+        players = summarize_players(new_matches)
+    elif os.path.exists(profile.players_file):
+        players = store.read_table(profile.players_file)
+        # matches already in the index got there in a run that failed before saving the manifest
+        new_matches = new_matches.loc[~new_matches["matchno"].isin(set(players["matchnos"].explode()))]
+        if len(new_matches) == 0:
+            return
+        players = merge_players(players, summarize_players(new_matches))
+    else: # processed before there was an index
+        players = summarize_players(store.read_matches(profile.matches_dir))
+    store.write_table(players, profile.players_file)
+
+def update_identity(new_matches, append, profile):
+    # the own profileid is only searched again if the new matches don't fit the known one
+    from match_utils import find_my_id
+    if not store.exists(profile.matches_dir):
+        return None
+    identity = load_identity(profile)
+    override = profile.my_profileid
+    if override and is_in_own_team(override, store.read_matches(profile.matches_dir, ["matchno", "profileid", "ownteam"])):
+        new_identity = {"profileid": override, "source": "override"}
+    elif append and identity is not None and identity["source"] == "detected" and is_in_own_team(identity["profileid"], new_matches):
+        new_identity = identity
+    else:
+        if override:
+            print(f"Ignoring my_profileid {override}, it is not in your team in every match.")
+        new_identity = {"profileid": find_my_id(store.read_matches(profile.matches_dir, IDENTITY_COLUMNS)), "source": "detected"}
+    if new_identity != identity:
+        with open(profile.identity_file, "w") as outfile:
+            json.dump(new_identity, outfile)
+    return new_identity["profileid"]
+
+def is_in_own_team(profileid, matches):
+    if matches is None:
+        return True
+    own = matches.loc[matches["ownteam"]]
+    return own.loc[own["profileid"] == profileid, "matchno"].nunique() == own["matchno"].nunique()
+
+def load_identity(profile=None):
+    profile = profile or get_profile()
+    try:
+        with open(profile.identity_file, "r") as infile:
+            return json.load(infile)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def write_summary(my_id, profile):
+    # one row per match, so the statistics don't have to aggregate all player rows
+    from match_utils import summarize_matches # not needed by the workers reading backups
+    if not store.exists(profile.matches_dir):
+        if os.path.exists(profile.summary_file):
+            os.remove(profile.summary_file)
+        return
+    summary = summarize_matches(store.read_matches(profile.matches_dir, SUMMARY_COLUMNS), my_id)
+    store.write_table(summary, profile.summary_file)
+
+def read_backups(paths, backend, workers=1):
+    args = (paths, repeat(backend))
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(min(workers, len(paths))) as executor:
+            yield from executor.map(read_backup, *args, chunksize=16)
+    else:
+        yield from map(read_backup, *args)
+
+def read_backup(path, backend):
+    stopwatch = Stopwatch()
+    with open(path, "rb") as infile:
+        content = infile.read()
+    stopwatch.lap("read")
+    content_hash = hash_content(content)
+    stopwatch.lap("hash")
+    try:
+        match = parse_xml_cached(content, backend, content_hash, stopwatch)
+        match_hash = create_match_hash(match)
+        stopwatch.lap("match_hash")
+    except Exception as e:
+        return content_hash, None, None, {"reason": str(e) or type(e).__name__}, stopwatch.laps
+    return content_hash, match, match_hash, None, stopwatch.laps
+
+
+class MatchBatch:
+    # collects player rows of many matches column by column, so the frame only has to be built once
+    def __init__(self):
+        self.columns = {}
+        self.n_rows = 0
+
+    def __len__(self):
+        return self.n_rows
+
+    def add(self, match, **constants):
+        for row in match:
+            row = row | constants
+            if row.keys() != self.columns.keys():
+                for column in row.keys():
+                    if column not in self.columns: # new columns are empty for previous rows
+                        self.columns[column] = [None] * self.n_rows
+            for column, values in self.columns.items():
+                values.append(row.get(column))
+            self.n_rows += 1
+
+    def to_frame(self):
+        return convert_player_columns(pd.DataFrame(self.columns))
+
+
+def get_pending_files(files, manifest):
+    known = manifest["files"]
+    if not set(known.keys()) <= set(files):
+        return None
+    pending = []
+    for path in files:
+        size, mtime = stat_file(path)
+        entry = known.get(path)
+        if entry is None:
+            pending.append((path, size, mtime))
+        elif (entry["size"], entry["mtime"]) != (size, mtime):
+            with open(path, "rb") as infile:
+                if hash_content(infile.read()) != entry["hash"]:
+                    return None
+            entry["size"], entry["mtime"] = size, mtime
+    # new files are only appended if they come after everything already processed
+    if len(pending) > 0 and len(known) > 0 and pending[0][0] < max(known.keys()):
+        return None
+    return pending
+
+def stat_file(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+def hash_content(content):
+    return hashlib.sha256(content).hexdigest()
+
+def load_manifest(profile):
+    try:
+        with open(profile.manifest_file, "r") as infile:
+            return json.load(infile)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_manifest(manifest, profile):
+    with open(profile.manifest_file, "w") as outfile:
+        json.dump(manifest, outfile)
+
+def load_quarantine(profile=None):
+    # files that could not be extracted, by path
+    profile = profile or get_profile()
+    try:
+        with open(profile.quarantine_file, "r") as infile:
+            return json.load(infile)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_quarantine(quarantine, profile):
+    with open(profile.quarantine_file, "w") as outfile:
+        json.dump(quarantine, outfile)
+
+def is_quarantined(entry, size, mtime, check_sanity):
+    # failed files are read again once they change, parsing changes or the failed check is turned off
+    return (
+        entry is not None
+        and (entry["size"], entry["mtime"]) == (size, mtime)
+        and entry["parser_version"] == PARSER_VERSION
+        and (entry["stage"] != "sanity_check" or check_sanity)
+    )
+
+def retry_quarantined(paths, profile=None):
+    # forgets that the files failed, the next extraction reads them again
+    profile = profile or get_profile()
+    with lock_results(profile):
+        quarantine, manifest = load_quarantine(profile), load_manifest(profile)
+        for path in paths:
+            quarantine.pop(path, None)
+            if manifest is not None:
+                manifest["files"].pop(path, None)
+        save_quarantine(quarantine, profile)
+        if manifest is not None:
+            save_manifest(manifest, profile)
+
+def load_run_stats(profile=None):
+    profile = profile or get_profile()
+    try:
+        with open(profile.run_stats_file, "r") as infile:
+            return json.load(infile)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_run_stats(stats, profile):
+    # summary of the last extraction, to see where the time went
+    with open(profile.run_stats_file, "w") as outfile:
+        json.dump(stats.to_dict(), outfile, indent=2)
+
+def load_match_hashes(profile):
+    # the same match recorded by several profiles has the same hash in all of their stores
+    manifest = load_manifest(profile) or {"files": {}}
+    return {entry["matchno"]: entry["match_hash"] for entry in manifest["files"].values() if entry["matchno"] is not None}
+
+@contextmanager
+def lock_results(profile, timeout=LOCK_TIMEOUT):
+    os.makedirs(profile.result_dir, exist_ok=True)
+    while True:
+        try:
+            os.close(os.open(profile.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time() - os.path.getmtime(profile.lock_file) > timeout: # left behind by a crashed process
+                    os.remove(profile.lock_file)
+            except FileNotFoundError:
+                pass
+            sleep(0.5)
+    # touch the lock while holding it, so a long extraction is never taken for a crashed one
+    released = threading.Event()
+    heartbeat = threading.Thread(target=refresh_lock, args=(profile.lock_file, timeout / 4, released), daemon=True)
+    heartbeat.start()
+    try:
+        yield
+    finally:
+        released.set()
+        heartbeat.join()
+        os.remove(profile.lock_file)
+
+def refresh_lock(lock_file, interval, released):
+    while not released.wait(interval):
+        try:
+            os.utime(lock_file)
+        except FileNotFoundError:
+            pass
+
+
+TEAM_INT_COLUMNS = ["mmr", "handicap", "numplayers"]
+TEAM_BOOL_COLUMNS = ["ownteam", "isinvite"]
+PLAYER_INT_COLUMNS = [
+    "bountyextracted",
+    "bountypickedup",
+    "downedbyme",
+    "downedbyteammate",
+    "downedme",
+    "downedteammate",
+    "killedbyme",
+    "killedbyteammate",
+    "killedme",
+    "killedteammate",
+    "mmr",
+]
+PLAYER_BOOL_COLUMNS = [
+    "hadWellspring",
+    "hadbounty",
+    "ispartner",
+    "issoulsurvivor",
+    "proximity",
+    "proximitytome",
+    "proximitytoteammate",
+    "skillbased",
+    "teamextraction",
+]
+
+IDENTITY_COLUMNS = ["profileid", "ownteam", "ispartner", "numplayers"]
+SUMMARY_COLUMNS = [
+    "matchno",
+    "teamno",
+    "datetime_match_ended",
+    "profileid",
+    "ownteam",
+    "ispartner",
+    "numplayers",
+    "survival",
+    "bountyextracted",
+    "downedbyme",
+    "killedbyme",
+    "downedme",
+    "killedme",
+    "mmr",
+    "bracket",
+]
+
+
+def parse_xml(xml, backend=None):
+    batch = MatchBatch()
+    batch.add(parse_xml_cached(xml, backend or get_xml_backend()))
+    return batch.to_frame().set_index(["teamno", "playerno"])
+
+def parse_xml_cached(content, backend="streaming", content_hash=None, stopwatch=None):
+    stopwatch = stopwatch or Stopwatch()
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    content_hash = content_hash or hash_content(content)
+    match = PARSE_CACHE.get(content_hash)
+    stopwatch.lap("cache_read")
+    if match is None:
+        match = read_match(content.decode("utf-8", errors="ignore"), backend, stopwatch)
+        PARSE_CACHE.set(content_hash, match)
+        stopwatch.lap("cache_write")
+    return match
+
+def read_match(xml, backend="streaming", stopwatch=None):
+    stopwatch = stopwatch or Stopwatch()
+    data = read_attributes(xml, backend)
+    stopwatch.lap("attributes")
     assert not string_to_bool(data["MissionBagIsQuickPlay"]), "Skipping quickplay match."
-    match = get_match_data(data)
-    match["survival"] = check_survival(data)
+    survival = check_survival(data)
+    match = [{**row, "survival": survival} for row in get_match_data(data)]
+    stopwatch.lap("convert")
     return match
 
+def get_xml_backend():
+    return os.getenv("xml_backend") or "streaming"
+
+def read_attributes(xml, backend="streaming"):
+    match backend:
+        case "streaming":
+            return read_attributes_streaming(xml)
+        case "xmltodict":
+            return read_attributes_xmltodict(xml)
+        case _:
+            raise ValueError(f"Unknown backend: {backend}")
+
+def read_attributes_streaming(xml):
+    # only keeps match related attributes while reading, everything else in the file is dropped right away
+    data = {}
+    def read_element(name, attributes):
+        if name == "Attr" and attributes.get("name", "").startswith(MATCH_ATTRIBUTE_PREFIXES):
+            data[attributes["name"]] = attributes["value"]
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = read_element
+    parser.Parse(xml, True)
+    return data
+
+def read_attributes_xmltodict(xml):
+    data = xmltodict.parse(xml)
+    # cleanup names and transform to usable dict
+    return {x["@name"]: x["@value"] for x in data["Attributes"]["Attr"]}
+
 def get_match_data(data):
-    kw = "MissionBag"
-    data = {key.replace(kw, ""): val for key, val in data.items() if kw in key}
+    data = route_attributes(data)
     teams = get_teams_data(data)
     players = get_players_data(data, teams)
-    match = players.join(teams, rsuffix="_team")
+    # join team metadata, one row per player
+    match = []
+    for pdata in players:
+        row = dict(pdata)
+        for key, value in teams[pdata["teamno"]].items():
+            row[f"{key}_team" if key in pdata else key] = value
+        match.append(row)
     return match
 
+def route_attributes(data):
+    # sort every attribute into a nested structure by the segments of its name, e.g.
+    # MissionBagPlayer_1_0_mmr -> players[1][0]["mmr"], MissionBagTeam_1 -> teams[1][""]
+    routed = {"match": {}, "teams": {}, "players": {}, "accolades": {}, "entries": {}}
+    for key, value in data.items():
+        kind, _, rest = key.partition("_")
+        match kind:
+            case "MissionBagTeam":
+                team, _, attribute = rest.partition("_")
+                if team.isdigit():
+                    routed["teams"].setdefault(int(team), {})[attribute] = value
+                    continue
+            case "MissionBagPlayer":
+                team, _, rest = rest.partition("_")
+                player, _, attribute = rest.partition("_")
+                if team.isdigit() and player.isdigit():
+                    routed["players"].setdefault(int(team), {}).setdefault(int(player), {})[attribute] = value
+                    continue
+            case "MissionAccoladeEntry":
+                accolade, _, attribute = rest.partition("_")
+                if accolade.isdigit():
+                    routed["accolades"].setdefault(int(accolade), {})[attribute] = value
+                    continue
+            case "MissionBagEntry":
+                entry, _, attribute = rest.partition("_")
+                if entry.isdigit():
+                    routed["entries"].setdefault(int(entry), {})[attribute] = value
+                    continue
+        if key.startswith("MissionBag"):
+            routed["match"][key.replace("MissionBag", "", 1)] = value
+    return routed
+
 def get_teams_data(data):
-    n_teams = int(data["NumTeams"])
-    teams = pd.DataFrame()
+    n_teams = int(data["match"]["NumTeams"])
+    teams = {}
     for team in range(n_teams):
-        tdata = {"_".join(x.split("_")[2::]): data[x] for x in data.keys() if f"Team_{team}" in x}
+        tdata = dict(data["teams"].get(team, {}))
         if tdata[""] == "1":
             del tdata[""] # will be needed anymore
-            tdata["teamno"] = team
-            # transform values to lists of length one to ease creating pandas from dict
-            tdata = pd.DataFrame.from_dict({key: [tdata[key]] for key in tdata.keys()})
-            teams = pd.concat([teams, pd.DataFrame.from_dict(tdata)])
-    teams = teams.set_index("teamno")
-    # dtype conversions
-    teams["mmr"] = teams["mmr"].astype(int)
-    teams["handicap"] = teams["handicap"].astype(int)
-    teams["numplayers"] = teams["numplayers"].astype(int)
-    teams["ownteam"] = teams["ownteam"].apply(string_to_bool)
-    teams["isinvite"] = teams["isinvite"].apply(string_to_bool)
+            # dtype conversions
+            for key in TEAM_INT_COLUMNS:
+                tdata[key] = int(tdata[key])
+            for key in TEAM_BOOL_COLUMNS:
+                tdata[key] = string_to_bool(tdata[key])
+            teams[team] = tdata
     return teams
 
 def get_players_data(data, teams):
-    players = pd.DataFrame()
-    for team, subset in teams.groupby("teamno"):
-        for player in range(subset["numplayers"].unique()[0]):
-            pdata = {"_".join(x.split("_")[3::]): data[x] for x in data.keys() if f"Player_{team}_{player}" in x}
-            if len(pdata) != 0:
-                pdata["teamno"] = team
-                pdata["playerno"] = player
-                # transform values to lists of length one to ease creating pandas from dict
-                pdata = pd.DataFrame.from_dict({key: [pdata[key]] for key in pdata.keys()})
-                players = pd.concat([players, pdata], ignore_index=True)
-    # dtype conversions
-    players["bountyextracted"] = players["bountyextracted"].astype(int)
-    players["bountypickedup"] = players["bountypickedup"].astype(int)
-    players["downedbyme"] = players["downedbyme"].astype(int)
-    players["downedbyteammate"] = players["downedbyteammate"].astype(int)
-    players["downedme"] = players["downedme"].astype(int)
-    players["downedteammate"] = players["downedteammate"].astype(int)
-    players["killedbyme"] = players["killedbyme"].astype(int)
-    players["killedbyteammate"] = players["killedbyteammate"].astype(int)
-    players["killedme"] = players["killedme"].astype(int)
-    players["killedteammate"] = players["killedteammate"].astype(int)
-    players["mmr"] = players["mmr"].astype(int)
-    players["hadWellspring"] = players["hadWellspring"].apply(string_to_bool)
-    players["hadbounty"] = players["hadbounty"].apply(string_to_bool)
-    players["ispartner"] = players["ispartner"].apply(string_to_bool)
-    players["issoulsurvivor"] = players["issoulsurvivor"].apply(string_to_bool)
-    players["proximity"] = players["proximity"].apply(string_to_bool)
-    players["proximitytome"] = players["proximitytome"].apply(string_to_bool)
-    players["proximitytoteammate"] = players["proximitytoteammate"].apply(string_to_bool)
-    players["skillbased"] = players["skillbased"].apply(string_to_bool)
-    players["teamextraction"] = players["teamextraction"].apply(string_to_bool)
-    # join team metatadata
-    players = players.set_index(["teamno", "playerno"])
+    players = []
+    for team in sorted(teams.keys()):
+        team_players = data["players"].get(team, {})
+        for player in range(teams[team]["numplayers"]):
+            pdata = dict(team_players.get(player, {}))
+            if len(pdata) != 0: # dtypes are converted for all players at once, see convert_player_columns
+                players.append({"teamno": team, "playerno": player, **pdata})
     return players
 
+def convert_player_columns(frame):
+    # values that can not be converted become NaN, see find_invalid_values
+    for column in PLAYER_INT_COLUMNS:
+        if column in frame.columns:
+            frame[column] = pd.to_numeric(frame[column], errors="coerce")
+    for column in PLAYER_BOOL_COLUMNS:
+        if column in frame.columns:
+            frame[column] = strings_to_bool(frame[column])
+    return frame
+
+def find_invalid_values(matches):
+    # the first player column per match with a missing or unconvertible value, NaN if all are fine
+    invalid = matches.reindex(columns=PLAYER_INT_COLUMNS + PLAYER_BOOL_COLUMNS).isna().groupby(matches["matchno"]).any()
+    return ("Invalid value for " + invalid.idxmax(axis=1) + ".").where(invalid.any(axis=1))
 
-@cache(persist=True, show_spinner=False)
-def create_match_hash(data):
-    return hashlib.sha256(pd.util.hash_pandas_object(data[["profileid", "mmr"]], index=False).values).hexdigest()
 
+def create_match_hash(match):
+    players = "\n".join(f"{row['profileid']}:{row['mmr']}" for row in match)
+    return hashlib.sha256(players.encode("utf-8")).hexdigest()
 
-def sanity_check(data):
-    data = data.reset_index()
-    # counting players
-    assert data["profileid"].nunique() <= 12, "Too many players."
-    assert all(data.groupby("profileid")["teamno"].nunique() == 1), "Same player in multiple teams."
-    assert all(data.groupby("teamno")["playerno"].nunique() == data.groupby("teamno")["profileid"].nunique()), "Player-indicies don't match team size."
-    largest_teamsize = data.groupby("teamno")["profileid"].nunique().max()
-    assert largest_teamsize <= 3, "Team too large."
-    assert data["ispartner"].sum() <= largest_teamsize, "Too many teammates."
-    # couting bounties
-    assert data["bountyextracted"].dropna().astype(int).sum() <= 4, "Too many extracted bounties."
+
+def sanity_check(matches):
+    # checks all matches at once, the first reason why a match makes no sense or NaN if it is fine
+    by_match = matches.groupby("matchno")
+    teams_per_player = matches.groupby(["matchno", "profileid"], observed=True)["teamno"].nunique()
+    teams = matches.groupby(["matchno", "teamno"]).agg(players=("profileid", "nunique"), playernos=("playerno", "nunique"))
+    largest_teamsize = teams["players"].groupby("matchno").max()
+    failed = pd.DataFrame({
+        # counting players
+        "Too many players.": by_match["profileid"].nunique() > 12,
+        "Same player in multiple teams.": (teams_per_player > 1).groupby("matchno").any(),
+        "Player-indicies don't match team size.": (teams["players"] != teams["playernos"]).groupby("matchno").any(),
+        "Team too large.": largest_teamsize > 3,
+        "Too many teammates.": by_match["ispartner"].sum() > largest_teamsize,
+        # couting bounties
+        "Too many extracted bounties.": by_match["bountyextracted"].sum() > 4,
+    })
+    return failed.idxmax(axis=1).where(failed.any(axis=1)).rename("sanity_issue")
 
 
 def string_to_bool(string: str) -> bool:
@@ -148,28 +632,35 @@ def string_to_bool(string: str) -> bool:
             return False
 
 
+def strings_to_bool(strings):
+    # string_to_bool for a whole column
+    return strings.astype(str).str.casefold().map({"true": True, "false": False})
+
+
 def check_survival(data):
     return not string_to_bool(data["MissionBagIsHunterDead"])
 
 def get_accolades(data):
-    accolades = pd.DataFrame()
-    for a in range(int(data["MissionBagNumAccolades"])):
-        adata = {"_".join(x.split("_")[2::]): data[x] for x in data.keys() if f"MissionAccoladeEntry_{a}" in x}
-        adata = pd.DataFrame.from_dict({key: [adata[key]] for key in adata.keys()})
+    data = route_attributes(data)
+    accolades = []
+    for a in range(int(data["match"]["NumAccolades"])):
+        adata = dict(data["accolades"].get(a, {}))
         adata["entry"] = f"Accolade #{a}"
-        accolades = pd.concat([accolades, adata], ignore_index=True)
+        accolades.append(adata)
+    accolades = pd.DataFrame.from_records(accolades)
     del accolades[""]
     del accolades["iconPath"]
     del accolades["header"]
-    # bagentries = pd.DataFrame()
-    # for b in range(int(data["MissionBagNumEntries"])):
-    #     bdata = {"_".join(x.split("_")[2::]): data[x] for x in data.keys() if f"MissionBagEntry_{a}" in x}
-    #     bdata = pd.DataFrame.from_dict({key: [bdata[key]] for key in bdata.keys()})
+    # bagentries = []
+    # for b in range(int(data["match"]["NumEntries"])):
+    #     bdata = dict(data["entries"].get(b, {}))
     #     bdata["entry"] = f"BagEntry #{b}"
-    #     bagentries = pd.concat([bagentries, bdata], ignore_index=True)
-    # return pd.concat([accolades, bagentries])
+    #     bagentries.append(bdata)
+    # return pd.concat([accolades, pd.DataFrame.from_records(bagentries)])
     return accolades
 
 
 if __name__ == "__main__":
-    [print(path) for _, path in main()]
+    from dotenv import load_dotenv
+    load_dotenv()
+    extract_profiles(list(load_profiles().values()), workers=os.cpu_count())
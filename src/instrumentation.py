@@ -0,0 +1,93 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+import numpy as np
+
+
+HISTOGRAM_BINS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, np.inf] # in ms
+
+
+class Stopwatch:
+    # durations of consecutive steps, in seconds
+    def __init__(self):
+        self.laps = {}
+        self.last = perf_counter()
+
+    def lap(self, name):
+        now = perf_counter()
+        self.laps[name] = now - self.last
+        self.last = now
+
+
+class RunStats:
+    # counters and timings of one extraction, per file steps happen in the workers reading backups
+    def __init__(self):
+        self.started = datetime.now()
+        self.start = perf_counter()
+        self.counters = Counter()
+        self.errors = Counter() # by reason
+        self.file_steps = defaultdict(list)
+        self.stages = defaultdict(float)
+        self.memory = {}
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def add_file(self, laps):
+        self.count("files")
+        if "match_hash" in laps and "cache_write" not in laps:
+            self.count("cache_hits")
+        for name, duration in laps.items():
+            self.file_steps[name].append(duration)
+
+    def add_error(self, error):
+        self.count("errors")
+        self.errors[error] += 1
+
+    @contextmanager
+    def stage(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += perf_counter() - start
+
+    def add_memory(self, name, frame):
+        self.memory[name] = round(frame.memory_usage(deep=True).sum() / 2**20, 2) # in MB
+
+    def get_duration(self):
+        return perf_counter() - self.start
+
+    def get_files_per_second(self):
+        return self.counters["files"] / max(self.get_duration(), 1e-9)
+
+    def to_dict(self):
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": round(self.get_duration(), 3),
+            "files_per_second": round(self.get_files_per_second(), 1),
+            "counters": dict(self.counters),
+            "errors": dict(self.errors.most_common()),
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            "file_steps": {name: summarize_durations(durations) for name, durations in self.file_steps.items()},
+            "memory_mb": self.memory,
+        }
+
+
+def summarize_durations(durations):
+    ms = np.array(durations) * 1000
+    counts, _ = np.histogram(ms, HISTOGRAM_BINS)
+    return {
+        "files": len(ms),
+        "seconds": round(ms.sum() / 1000, 4),
+        "mean_ms": round(ms.mean(), 3),
+        "p50_ms": round(np.percentile(ms, 50), 3),
+        "p90_ms": round(np.percentile(ms, 90), 3),
+        "p99_ms": round(np.percentile(ms, 99), 3),
+        "max_ms": round(ms.max(), 3),
+        "histogram_ms": {
+            f"<{upper:g}" if upper < np.inf else f">={lower:g}": int(n)
+            for lower, upper, n in zip(HISTOGRAM_BINS[:-1], HISTOGRAM_BINS[1:], counts)
+        },
+    }
@@ -0,0 +1,104 @@
+from match_utils import (
+    simplify_scoreboard,
+    get_my_matches,
+    get_up_to_n_last_matches,
+    get_mmr_estimate_error,
+    update_elo_scores,
+    get_mmr_bracket,
+)
+
+
+# every metric is a dict with the arguments of st.metric, so it can be shown in the app or written to a report
+
+def get_fighting_KPIs(summary, trend_window=3):
+    summary_old = get_up_to_n_last_matches(summary, trend_window)
+    kd = get_KD_ratio(summary["kills"].sum(), summary["deaths"].sum())
+    kd_old = get_KD_ratio(summary_old["kills"].sum(), summary_old["deaths"].sum())
+    er = summary["bountyextracted"].mean()
+    er_old = summary_old["bountyextracted"].mean()
+    rate = summary["survival"].mean()
+    rate_old = summary_old["survival"].mean()
+    return [
+        dict(
+            label = "K/D Ratio",
+            value = round(kd, 2),
+            delta = f"{round(kd - kd_old, 2)} in last {trend_window} matches",
+        ),
+        dict(
+            label = "Min. one bounty extracted",
+            value = f"{round(er * 100, 1)}%",
+            delta = f"{round((er - er_old) * 100, 1)}% in last {trend_window} matches",
+        ),
+        dict(
+            label = "Hunter survived",
+            value = f"{round(rate * 100, 1)}%",
+            delta = f"{round((rate - rate_old) * 100, 1)}% in last {trend_window} matches",
+        ),
+    ]
+
+def get_KD(df, split=False):
+    df = simplify_scoreboard(df)
+    killed = df["shotbyme"].sum()
+    died = df["shotme"].sum()
+    if split:
+        return killed, died
+    else:
+        return get_KD_ratio(killed, died)
+
+def get_KD_ratio(killed, died):
+    died = max(died, 1) # treat zero deaths as one to avoid dividing by zero
+    return killed / died
+
+
+def get_mmr_KPIs(matches, summary, my_id=None, trend_window=3):
+    total_mmr_taken, max_mmr_taken, max_mmr_taken_victim, ranks_taken, deranked = get_mmr_taken_KPIs(matches, my_id)
+    mmr = summary["mmr_out_estimated"].iloc[-1]
+    mmr_old = summary["mmr"].iloc[-(trend_window-1)]
+    return [
+        dict(
+            label = "MMR",
+            value = f"~{mmr}",
+            delta = f"{mmr - mmr_old} in last {trend_window} matches",
+            help = (
+                "The data only contains the MMR before a match start. But based on your last match, your current MMR can be estimated. "
+                f"So far the estimates were off by {get_mmr_estimate_error(summary):.0f} on average."
+            ),
+        ),
+        dict(
+            label = "MMR taken from others",
+            value = int(total_mmr_taken),
+            help = f"Max. -{int(max_mmr_taken)} from {max_mmr_taken_victim}",
+        ),
+        dict(
+            label = "Ruined someones day",
+            value = f"{int(ranks_taken)}×",
+            help = "\n\n".join(sorted(deranked)),
+        ),
+    ]
+
+def get_mmr_taken_KPIs(matches, my_id=None):
+    # same order as when grouping by match and player, so ties are resolved the same way
+    matches = matches.sort_values(["matchno", "profileid"], kind="stable", ignore_index=True)
+    my_mmr = get_my_matches(matches, my_id).set_index("matchno")["mmr"]
+    my_mmr = my_mmr.reindex(matches["matchno"]).reset_index(drop=True)
+    shotbyme = matches["downedbyme"] + matches["killedbyme"]
+    shotme = matches["downedme"] + matches["killedme"]
+    mmr_taken = update_elo_scores(my_mmr, matches["mmr"], 1, return_updated=False) * shotbyme
+    mmr_lost = update_elo_scores(my_mmr, matches["mmr"], 0, return_updated=False) * shotme
+    mmr_taken = mmr_taken.mask(mmr_taken > 0, mmr_taken + mmr_lost) # correct for trades (sign is negative by default)
+    taken = mmr_taken > 0
+    if not taken.any():
+        return 0, 0, "", 0, set()
+    mmr_taken, victims = mmr_taken[taken], matches.loc[taken]
+    victims = victims["blood_line_name"].astype(str) + " (#" + (victims["matchno"] + 1).astype(str) + ")"
+    rank_before = matches.loc[taken, "bracket"].to_numpy()
+    rank_after = get_mmr_bracket(matches.loc[taken, "mmr"] - mmr_taken)
+    deranked = rank_before > rank_after
+    deranked_victims = victims[deranked] + [f" {before}↘{after}" for before, after in zip(rank_before[deranked], rank_after[deranked])]
+    return (
+        mmr_taken.sum(),
+        mmr_taken.max(),
+        victims.loc[mmr_taken.idxmax()], # first one in case of ties
+        (rank_before - rank_after)[deranked].sum(),
+        set(deranked_victims),
+    )
@@ -1,6 +1,10 @@
 from datetime import datetime
 from sklearn.linear_model import LinearRegression
+from scipy import sparse, linalg
+from scipy.optimize import minimize
+from scipy.special import expit
 import pandas as pd
+import numpy as np
 
 
 MMR_BRACKETS = { # upper boundaries
@@ -12,12 +16,18 @@ MMR_BRACKETS = { # upper boundaries
     5: 3000,
     6: 5000,
 }
+BRACKETS = np.array(sorted(MMR_BRACKETS.keys()))
+BRACKET_BOUNDARIES = np.array([MMR_BRACKETS[bracket] for bracket in BRACKETS])
+SUCCESS_TARGETS = { # summary column for each kind of success
+    "extracting with a bounty": "bountyextracted",
+    "surviving": "survival",
+}
 
 
 def get_mmr_bracket(mmr):
-    for bracket in sorted(MMR_BRACKETS.keys()):
-        if MMR_BRACKETS[bracket] > mmr:
-            return bracket
+    # works on single values and whole arrays alike, extraction stores it as column "bracket"
+    index = np.searchsorted(BRACKET_BOUNDARIES, mmr, side="right")
+    return BRACKETS[np.minimum(index, len(BRACKETS) - 1)]
 
 def construct_match_name(subset, my_id=""):
     teammates = subset[subset.ownteam & (subset.profileid != my_id)]
@@ -34,10 +44,12 @@ def construct_match_name(subset, my_id=""):
 
 
 def simplify_scoreboard(data):   
-    data["shotbyme"] = data[["downedbyme", "killedbyme"]].sum(axis=1)
-    data["shotme"] = data[["downedme", "killedme",]].sum(axis=1)
-    data["shotbyteammate"] = data[["downedbyteammate", "killedbyteammate"]].sum(axis=1)
-    data["shotteammate"] = data[["downedteammate", "killedteammate"]].sum(axis=1)
+    data = data.assign( # don't modify the passed frame
+        shotbyme = data[["downedbyme", "killedbyme"]].sum(axis=1),
+        shotme = data[["downedme", "killedme",]].sum(axis=1),
+        shotbyteammate = data[["downedbyteammate", "killedbyteammate"]].sum(axis=1),
+        shotteammate = data[["downedteammate", "killedteammate"]].sum(axis=1),
+    )
     data = data.reset_index(drop=True)[[
         "blood_line_name",
         "mmr",
@@ -50,15 +62,48 @@ def simplify_scoreboard(data):
     return data
 
 
+def summarize_matches(matches, my_id=None):
+    my_id = my_id or find_my_id(matches)
+    matches = matches.assign(
+        kills = matches["downedbyme"] + matches["killedbyme"],
+        deaths = matches["downedme"] + matches["killedme"],
+    )
+    mine = matches.loc[matches["profileid"] == my_id].set_index("matchno")
+    by_match = matches.groupby("matchno")
+    own = matches.loc[matches["ownteam"]].groupby("matchno")
+    enemy_team_sizes = matches.loc[~matches["ownteam"]].groupby(["matchno", "teamno"]).size()
+    summary = pd.DataFrame({
+        "datetime_match_ended": by_match["datetime_match_ended"].first(),
+        "survival": by_match["survival"].first(), # the same for the whole match
+        "bountyextracted": own["bountyextracted"].sum() > 0,
+        "my_team_size": own.size(),
+        "enemy_team_size": enemy_team_sizes.groupby("matchno").max(),
+        "kills": by_match["kills"].sum(),
+        "deaths": by_match["deaths"].sum(),
+        "mmr": mine["mmr"],
+        "mmr_out_estimated": estimate_mmr_out(matches, my_id),
+        "bracket": mine["bracket"],
+    })
+    summary["enemy_team_size"] = summary["enemy_team_size"].fillna(0)
+    return summary.astype({
+        "my_team_size": "int8",
+        "enemy_team_size": "int8",
+        "kills": "int16",
+        "deaths": "int16",
+        "mmr_out_estimated": "Int16", # missing in matches without me
+    }).rename_axis("matchno").reset_index()
+
+
 def get_own_team(df):
     return df.loc[df["ownteam"]]
 
-def get_my_matches(matches):
-    my_id = find_my_id(matches)
+def get_my_matches(matches, my_id=None):
+    my_id = my_id or find_my_id(matches)
     df = matches.loc[matches.profileid == my_id]
     return df
 
 def find_my_id(matches):
+    # scans all matches, use the id resolved during extraction where possible
     for func in [find_my_id_by_flags, find_my_id_from_solo_matches, find_my_id_by_most_frequnt_player]:
         try:
             return func(matches)
@@ -82,7 +127,7 @@ def get_unique_id(df):
     return ids[0]
 
 def find_my_id_by_most_frequnt_player(matches):
-    player_frequency = matches.groupby("profileid").size()
+    player_frequency = matches.groupby("profileid", observed=True).size()
     most_frequent_players = player_frequency.loc[player_frequency == player_frequency.max()]
     assert len(most_frequent_players) == 1, "Most frequent player is ambiguous."
     return most_frequent_players.index[0]
@@ -94,7 +139,7 @@ def get_up_to_n_last_matches(df, n):
     return df.loc[df["matchno"] <= df["matchno"].max() - n]
 
 def get_profileid_map(matches):
-    return matches.groupby("profileid")["blood_line_name"].last().to_dict()
+    return matches.groupby("profileid", observed=True)["blood_line_name"].last().to_dict()
 
 
 def predict_mmr(matches, method="elo"):
@@ -146,20 +191,59 @@ def predict_mmr_linreg(matches):
     return newest_match.values[0]
 
 def predict_mmr_elo(matches):
-    last_match_nr = matches["matchno"].max()
-    matches = matches.set_index("matchno")
-    mine = get_my_matches(matches)
-    mmr = mine.loc[last_match_nr, "mmr"]
-    lastmatch = matches.loc[last_match_nr]
-    # unite downed and killed
-    lastmatch["shotbyme"] = lastmatch[["downedbyme", "killedbyme"]].sum(axis=1)
-    lastmatch["shotme"] = lastmatch[["downedme", "killedme",]].sum(axis=1)
-    change = 0
-    for _, row in lastmatch.groupby("profileid"):
-        kills = update_elo_scores(mmr, row["mmr"], 1, return_updated=False) * row["shotbyme"]
-        deaths = update_elo_scores(mmr, row["mmr"], 0, return_updated=False) * row["shotme"]
-        change += kills + deaths
-    return int(mmr + change)
+    return estimate_mmr_out(matches).iloc[-1]
+
+def estimate_mmr_out(matches, my_id=None):
+    # replays the whole history at once, every kill and death counts as one elo game against that player
+    my_id = my_id or find_my_id(matches)
+    my_mmr = matches.loc[matches["profileid"] == my_id].set_index("matchno")["mmr"]
+    mmr = my_mmr.reindex(matches["matchno"]).set_axis(matches.index)
+    kills = update_elo_scores(mmr, matches["mmr"], 1, return_updated=False) * (matches["downedbyme"] + matches["killedbyme"])
+    deaths = update_elo_scores(mmr, matches["mmr"], 0, return_updated=False) * (matches["downedme"] + matches["killedme"])
+    change = (kills + deaths).groupby(matches["matchno"]).sum()
+    return (my_mmr + change.reindex(my_mmr.index)).astype(int) # only for the matches I played in
+
+def get_mmr_estimate_error(summary):
+    # how far the estimates were off from the mmr recorded at the start of the next match
+    return (summary["mmr_out_estimated"] - summary["mmr"].shift(-1)).abs().mean()
+
+def get_teammate_matrix(matches):
+    # one row per match and one column per player in my team, sparse since most teammates are randoms
+    own = matches.loc[matches["ownteam"]]
+    matchnos, rows = np.unique(own["matchno"].to_numpy(), return_inverse=True)
+    profileids, columns = np.unique(own["profileid"].astype(str).to_numpy(), return_inverse=True)
+    X = sparse.csr_matrix((np.ones(len(own)), (rows, columns)), shape=(len(matchnos), len(profileids)))
+    return X, matchnos, profileids
+
+def fit_teammate_effects(X, y, profileids, minimum_matches=3, penalty=1.0):
+    # regularized logistic regression, so separable data doesn't break the fit and no refitting is needed
+    # only if the results are still unusable the threshold is raised, starting from the previous solution
+    matches_per_player = np.asarray(X.sum(axis=0)).ravel()
+    assert (matches_per_player >= minimum_matches).any(), "Not enough matches recorded."
+    coefficients = {}
+    for threshold in range(minimum_matches, int(matches_per_player.max()) + 1):
+        selected = matches_per_player >= threshold
+        X_selected = X[:, selected]
+        start = np.array([coefficients.get(profileid, 0.0) for profileid in profileids[selected]])
+        result = minimize(get_logit_loss, start, args=(X_selected, y, penalty), jac=True, method="L-BFGS-B")
+        coefficients = dict(zip(profileids[selected], result.x))
+        p = expit(X_selected @ result.x)
+        hessian = (X_selected.T @ sparse.diags(p * (1 - p)) @ X_selected).toarray() + penalty * np.eye(len(result.x))
+        errors = 1.96 * np.sqrt(np.diag(linalg.inv(hessian))) # 95% confidence
+        if result.success and np.isfinite(np.exp(np.abs(result.x) + errors)).all():
+            break
+    effects = pd.DataFrame({
+        "effect": result.x,
+        "lower": result.x - errors,
+        "upper": result.x + errors,
+    }, index=profileids[selected])
+    return effects, threshold
+
+def get_logit_loss(coefficients, X, y, penalty):
+    z = X @ coefficients
+    loss = np.sum(np.logaddexp(0, z) - y * z) + penalty / 2 * coefficients @ coefficients
+    gradient = X.T @ (expit(z) - y) + penalty * coefficients
+    return loss, gradient
 
 def update_elo_scores(p1, p2, result=1, k=32, return_updated=True):
     assert (result >= 0) and (result <= 1) # 1: p1 wins, 0: p2 wins
@@ -0,0 +1,53 @@
+import pandas as pd
+
+
+LIST_COLUMNS = ["aliases", "matchnos", "mmrs"]
+
+
+def summarize_players(matches):
+    # one row per player with everything needed to look them up, without going through all matches again
+    matches = matches.assign(
+        profileid = matches["profileid"].astype(str),
+        blood_line_name = matches["blood_line_name"].astype(str),
+        teammate = matches["ownteam"],
+        enemy = ~matches["ownteam"],
+        # the counters of one match are stored as int8, their totals over all matches don't fit
+        kills = matches["downedbyme"].astype("int32") + matches["killedbyme"],
+        deaths = matches["downedme"].astype("int32") + matches["killedme"],
+    ).sort_values("matchno", kind="stable")
+    by_player = matches.groupby("profileid")
+    players = pd.DataFrame({
+        "name": by_player["blood_line_name"].last(),
+        "aliases": by_player["blood_line_name"].unique().map(list),
+        "encounters": by_player["matchno"].nunique(),
+        "as_teammate": by_player["teammate"].sum(),
+        "as_enemy": by_player["enemy"].sum(),
+        "kills": by_player["kills"].sum(),
+        "deaths": by_player["deaths"].sum(),
+        "first_seen": by_player["datetime_match_ended"].first(),
+        "last_seen": by_player["datetime_match_ended"].last(),
+        "matchnos": by_player["matchno"].agg(list),
+        "mmrs": by_player["mmr"].agg(list),
+    })
+    return players.rename_axis("profileid").reset_index()
+
+def merge_players(players, new):
+    # players met again are combined, everyone else is just kept or added
+    players, new = players.set_index("profileid"), new.set_index("profileid")
+    for column in LIST_COLUMNS: # stored lists are read as arrays
+        players[column] = players[column].map(list)
+    again = players.index.intersection(new.index)
+    old, update = players.loc[again], new.loc[again]
+    merged = update.assign(
+        aliases = [a + [alias for alias in b if alias not in a] for a, b in zip(old["aliases"], update["aliases"])],
+        encounters = old["encounters"] + update["encounters"],
+        as_teammate = old["as_teammate"] + update["as_teammate"],
+        as_enemy = old["as_enemy"] + update["as_enemy"],
+        kills = old["kills"] + update["kills"],
+        deaths = old["deaths"] + update["deaths"],
+        first_seen = old["first_seen"],
+        matchnos = old["matchnos"] + update["matchnos"],
+        mmrs = old["mmrs"] + update["mmrs"],
+    )
+    players = pd.concat([players.drop(again), merged, new.drop(again)])
+    return players.rename_axis("profileid").reset_index()
@@ -4,149 +4,37 @@ import pandas as pd
 from matplotlib import pyplot as plt
 import seaborn as sns
 from matplotlib.collections import PatchCollection
-from match_utils import (
-    simplify_scoreboard, 
-    get_my_matches, 
-    get_own_team, 
-    get_up_to_n_last_matches, 
-    get_profileid_map, 
-    predict_mmr,
-    update_elo_scores,
-    get_mmr_bracket,
-    MMR_BRACKETS,
-    find_my_id,
-)
+from match_utils import get_my_matches, BRACKETS, BRACKET_BOUNDARIES
+from kpis import get_fighting_KPIs, get_mmr_KPIs
 import streamlit as st
-import statsmodels.api as sm
 import numpy as np
 
 
-def display_fighting_KPIs(matches, trend_window):
-    columns = st.columns(3)
-    with columns[0]:
-        display_KD(matches, trend_window)
-    with columns[1]:
-        display_extraction_rate(matches, trend_window)
-    with columns[2]:
-        display_survival_rate(matches, trend_window)
-
-def display_survival_rate(df, trend_window):
-    df = get_my_matches(df)
-    df_old = get_up_to_n_last_matches(df, trend_window)
-    rate = df.survival.sum() / df.matchno.nunique()
-    rate_old = df_old.survival.sum() / df_old.matchno.nunique()
-    st.metric(
-        "Hunter survived",
-        f"{round(rate * 100, 1)}%",
-        f"{round((rate - rate_old) * 100, 1)}% in last {trend_window} matches"
-    )
-
-def display_extraction_rate(df, trend_window=3):
-    df = get_own_team(df)
-    df_old = get_up_to_n_last_matches(df, trend_window)
-    er = get_extraction_rate(df)
-    er_old = get_extraction_rate(df_old)
-    st.metric(
-        "Min. one bounty extracted",
-        f"{round(er * 100, 1)}%",
-        f"{round((er - er_old) * 100, 1)}% in last {trend_window} matches"
-    )
-
-def get_extraction_rate(df):
-    return df.groupby("matchno")["bountyextracted"].sum().astype(bool).sum() / df["matchno"].nunique()
-
-def display_KD(df, trend_window=3):
-    kd_old = get_KD(get_up_to_n_last_matches(df, trend_window))
-    kd = get_KD(df)
-    st.metric(
-        "K/D Ratio",
-        round(kd, 2),
-        f"{round(kd - kd_old, 2)} in last {trend_window} matches"
-    )
-
-def get_KD(df, split=False):
-    df = simplify_scoreboard(df)
-    killed = df["shotbyme"].sum()
-    died = df["shotme"].sum()
-    if split:
-        return killed, died
-    else:
-        died = max(died, 1) # treat zero deaths as one to avoid dividing by zero
-        return killed / died
+def display_fighting_KPIs(summary, trend_window):
+    display_metrics(get_fighting_KPIs(summary, trend_window))
 
+def display_mmr_KPIs(matches, summary, my_id, trend_window=3):
+    display_metrics(get_mmr_KPIs(matches, summary, my_id, trend_window))
 
-def display_mmr_KPIs(matches, trend_window=3):
-    df = matches
-    matches = matches.set_index("matchno")
-    mine = get_my_matches(matches)["mmr"]
-    mine.name = "my_mmr"
-    matches = matches.join(mine)
-    matches["shotbyme"] = matches[["downedbyme", "killedbyme"]].sum(axis=1)
-    matches["shotme"] = matches[["downedme", "killedme",]].sum(axis=1)
-    matches = matches.loc[(matches["shotbyme"] + matches["shotme"]) > 0] # skip irrelevant
-    total_mmr_taken = 0
-    max_mmr_taken = 0
-    max_mmr_taken_victim = ""
-    ranks_taken = 0
-    deranked = set()
-    for (matchno, profileid), row in matches.groupby(["matchno", "profileid"]):
-        mmr_taken = update_elo_scores(row["my_mmr"], row["mmr"], 1, return_updated=False) * row["shotbyme"]
-        mmr_taken = mmr_taken.iloc[0]
-        if mmr_taken > 0:
-            mmr_lost = update_elo_scores(row["my_mmr"], row["mmr"], 0, return_updated=False) * row["shotme"]
-            mmr_taken += mmr_lost.iloc[0] # correct for trades (sign is negative by default)
-        if mmr_taken > 0:
-            total_mmr_taken += mmr_taken
-            if mmr_taken > max_mmr_taken:
-                max_mmr_taken = mmr_taken
-                max_mmr_taken_victim = row["blood_line_name"].iloc[0] + f" (#{matchno+1})"
-            rank_before = get_mmr_bracket(row["mmr"].iloc[0]) 
-            rank_after = get_mmr_bracket(row["mmr"].iloc[0] - mmr_taken)
-            if rank_before > rank_after:
-                ranks_taken += rank_before - rank_after
-                deranked.add(row["blood_line_name"].iloc[0] + f" (#{matchno+1}) {rank_before}↘{rank_after}")
- 
-    columns = st.columns(3)
-    with columns[0]:
-        mmr = predict_mmr(df)
-        mmr_old = mine.iloc[-(trend_window-1)]
-        st.metric(
-            "MMR",
-            f"~{mmr}",
-            f"{mmr - mmr_old} in last {trend_window} matches",
-            help = "The data only contains the MMR before a match start. But based on your last match, your current MMR can be estimated."
-        )
-    with columns[1]:
-        st.metric(
-            "MMR taken from others",
-            value = int(total_mmr_taken),
-            help = f"Max. -{int(max_mmr_taken)} from {max_mmr_taken_victim}",
-        )
-    with columns[2]:
-        st.metric(
-            "Ruined someones day",
-            value = f"{int(ranks_taken)}×",
-            help = "\n\n".join(list(deranked)),
-        )
+def display_metrics(metrics):
+    for column, metric in zip(st.columns(len(metrics)), metrics):
+        with column:
+            st.metric(**metric)
 
 
-def plot_mmr_hisotry(matches, xaxis, mmr_out=False):
-    df = get_my_matches(matches)
+def plot_mmr_hisotry(matches, summary, my_id, xaxis, mmr_out=False):
+    df = get_my_matches(matches, my_id).copy()
     df["matchno"] += 1
     # star rating
-    levels = pd.DataFrame()
-    levels[xaxis] = df[xaxis]
-    levels = levels.loc[(levels[xaxis] == levels[xaxis].min()) | (levels[xaxis] == levels[xaxis].max())]
-    levels = levels.reset_index(drop=True)
-    for bracket in MMR_BRACKETS.keys():
-        levels[str(bracket)] = MMR_BRACKETS.get(bracket)
-    levels = levels.set_index(xaxis).stack().reset_index().rename({"level_1":"Stars", 0:"mmr"}, axis=1)
-    levels["delta"] = levels["mmr"].diff()
-    levels.loc[levels["delta"] < 0, "delta"] = None
+    levels = pd.DataFrame({ # one band per bracket from the first to the last match, stacked up to its boundary
+        xaxis: np.tile([df[xaxis].min(), df[xaxis].max()], len(BRACKETS)),
+        "Stars": np.repeat(BRACKETS.astype(str), 2),
+        "mmr": np.repeat(BRACKET_BOUNDARIES, 2),
+        "delta": np.repeat(np.diff(BRACKET_BOUNDARIES, prepend=np.nan), 2),
+    })
     # show mmr at match start or at match end
     if mmr_out:
-        df["mmr"] = df["mmr"].shift(-1)
-        df["mmr"].iloc[-1] = predict_mmr(matches)
+        df["mmr"] = df["mmr"].shift(-1).fillna(summary["mmr_out_estimated"].iloc[-1])
     mmr = px.scatter(
         df, 
         x = xaxis, 
@@ -195,13 +83,21 @@ def plot_mmr_hisotry(matches, xaxis, mmr_out=False):
     return fig
 
 
-def plot_match_endings(matches):
-    my = get_my_matches(matches)
-    died = (~my["survival"]).sum()
-    team = matches.loc[matches["ownteam"]].set_index("matchno")
-    survive_with_bounty = (team.loc[team["survival"]].groupby("matchno")["bountyextracted"].max() >= 1).sum()
-    survive_no_bounty = (team.loc[team["survival"]].groupby("matchno")["bountyextracted"].max() == 0).sum()
-    assert sum([survive_with_bounty, survive_no_bounty, died]) == matches["matchno"].nunique()
+def plot_player_mmr_history(player):
+    df = pd.DataFrame({"# of Match": player["matchnos"] + 1, "mmr": player["mmrs"]})
+    fig = px.line(df, x="# of Match", y="mmr", markers=True, color_discrete_sequence=["springgreen"])
+    fig.update_layout(
+        plot_bgcolor = "rgba(0, 0, 0, 0)",
+        paper_bgcolor = "rgba(0, 0, 0, 0)",
+        modebar = dict(bgcolor = 'rgba(0, 0, 0, 0)')
+    )
+    return fig
+
+
+def plot_match_endings(summary):
+    died = (~summary["survival"]).sum()
+    survive_with_bounty = (summary["survival"] & summary["bountyextracted"]).sum()
+    survive_no_bounty = (summary["survival"] & ~summary["bountyextracted"]).sum()
     data = pd.DataFrame.from_dict({
         "Ending": ["Extracted with Bounty", "Survived", "Died"],
         "n" : [survive_with_bounty, survive_no_bounty, died],
@@ -227,38 +123,22 @@ def plot_match_endings(matches):
     return fig
 
 
-def plot_team_sizes(matches, metric="matches played"):
-    teamsizes = matches.groupby(["matchno", "teamno"]).size().groupby("matchno").max()
-    teamsizes.name = "enemy_time_size"
-    own = get_own_team(matches)
-    my_team_sizes = own.groupby("matchno").size()
-    my_team_sizes.name = "my_team_size"
-    df = teamsizes.to_frame().join(my_team_sizes)
+def plot_team_sizes(summary, metric="matches played"):
+    by_team_sizes = summary.groupby(["enemy_team_size", "my_team_size"])
     if metric == "extraction rate":
-        bounty = own.groupby("matchno")["bountyextracted"].sum() > 0
-        bounty.name = "bounty_extracted"
-        df = df.join(bounty)
-        success_rate = df.groupby(["enemy_time_size", "my_team_size"])["bounty_extracted"].mean()
-        success_rate.name = "success_rate"
-        data = success_rate.to_frame().reset_index().pivot(index="enemy_time_size", columns="my_team_size")
+        data = by_team_sizes["bountyextracted"].mean()
     elif metric == "matches played":
-        frequency = df.groupby(["enemy_time_size", "my_team_size"]).size()
-        frequency.name = "frequency"
-        data = frequency.to_frame().reset_index().pivot(index="enemy_time_size", columns="my_team_size")
+        data = by_team_sizes.size()
     else:
-        survival = own.groupby("matchno")["survival"].sum() > 0
-        survival.name = "survival"
-        df = df.join(survival)
-        success_rate = df.groupby(["enemy_time_size", "my_team_size"])["survival"].mean()
-        success_rate.name = "success_rate"
-        data = success_rate.to_frame().reset_index().pivot(index="enemy_time_size", columns="my_team_size")
+        data = by_team_sizes["survival"].mean()
+    data = data.unstack("my_team_size")
     name_map = {1: "Solo", 2: "Duo", 3: "Trio"}
     sns.heatmap(
         data, 
         annot=True,
         fmt = ".0f" if metric == "matches played" else '.1%',
         yticklabels=[f"{name_map.get(y)}s" for y in data.index],
-        xticklabels=[name_map.get(x[1]) for x in data.columns],
+        xticklabels=[name_map.get(x) for x in data.columns],
         cbar = False,
         cmap = "winter",
     )
@@ -268,33 +148,14 @@ def plot_team_sizes(matches, metric="matches played"):
     return plt.gcf()
 
 
-def effect_on_success_chance(matches, target="extracting with a bounty", include_me=False, minimum_matches=3):
-    assert minimum_matches <= matches["matchno"].nunique(), "Not enough matches recorded."
+def effect_on_success_chance(effects, id_map, my_id, target="extracting with a bounty", include_me=False, minimum_matches=3):
     style_pyplot()
-    own = matches.loc[matches["ownteam"]].set_index("matchno")
-    if target == "extracting with a bounty":
-        y = own.groupby("matchno")["bountyextracted"].max() >= 1
-    elif target == "surviving":
-        y = own.groupby("matchno")["survival"].sum() >= 1
-    X = pd.get_dummies(own["profileid"]).groupby("matchno").sum()
-    matches_per_player = X.sum()
-    enough_matches = matches_per_player.loc[matches_per_player >= minimum_matches]
-    X = X[enough_matches.index]
-    model = sm.Logit(y,X)
-    try:
-        model = model.fit()
-    except Exception as e:
-        print(f"Error performing analysis with minimum_matches={minimum_matches}: {e}")
-        return effect_on_success_chance(matches, target, include_me, minimum_matches+1)
-    conf_int = model.conf_int()
-    results = model.params
     # remove results with error bars far larger than effect
-    errors_too_large = (results-conf_int[0]).abs() > results.abs() * 10
-    results = results.loc[~errors_too_large]
-    conf_int = conf_int.loc[~errors_too_large]
+    errors_too_large = (effects["effect"] - effects["lower"]).abs() > effects["effect"].abs() * 10
+    effects = effects.loc[~errors_too_large]
     if not include_me:
-        results = results.drop(find_my_id(matches))
-        conf_int = conf_int.drop(find_my_id(matches))
+        effects = effects.drop(my_id, errors="ignore")
+    results = effects["effect"]
     plt.barh(
         results.index,
         results,
@@ -306,7 +167,7 @@ def effect_on_success_chance(matches, target="extracting with a bounty", include
         x=results,
         fmt='o',
         capsize=5,
-        xerr=((results-conf_int[0]).abs(), conf_int[1]-results),
+        xerr=(results - effects["lower"], effects["upper"] - results),
         color = "white",
         label = "uncertainty",
     )
@@ -314,11 +175,7 @@ def effect_on_success_chance(matches, target="extracting with a bounty", include
     plt.xlabel(f"Odds of {target}")
     xticks = plt.gca().get_xticks()
     odds = np.exp(xticks)
-    if (odds == 0).any() or not np.isfinite(odds).any(): # check if any odds are not sensible
-        plt.close() # delete existing plot
-        return effect_on_success_chance(matches, target, include_me, minimum_matches+1)
     plt.xticks(xticks, [f"{round(o)}:1" if o >=1 else f"1:{round(1/o)}" for o in odds])
-    id_map = get_profileid_map(matches)
     plt.yticks(plt.gca().get_yticks(), [id_map.get(i) for i in results.index])
     plt.title(f"Teammates with at least {minimum_matches} matches together")
     return plt.gcf()
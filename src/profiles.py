@@ -0,0 +1,64 @@
+import os
+import json
+
+
+DATA_DIR = "data"
+PROFILES_DIR = os.path.join(DATA_DIR, "profiles")
+PROFILES_FILE = os.path.join(DATA_DIR, "profiles.json")
+DEFAULT_PROFILE = "default"
+
+
+class Profile:
+    # where the backups and the processed matches of one player are kept
+    # the default profile keeps the original layout, every other one gets its own folder
+    def __init__(self, name=DEFAULT_PROFILE, watched_file=None, backup_dir=None, my_profileid=None):
+        assert name == os.path.basename(name) and name not in ["", ".", ".."], f"Invalid profile name: {name}"
+        root = DATA_DIR if name == DEFAULT_PROFILE else os.path.join(PROFILES_DIR, name)
+        self.name = name
+        self.watched_file = watched_file
+        self.my_profileid = my_profileid
+        self.backup_dir = backup_dir or os.path.join(root, "raw")
+        self.result_dir = os.path.join(root, "processed")
+        self.matches_dir = os.path.join(self.result_dir, "matches")
+        self.summary_file = os.path.join(self.result_dir, "summary.parquet")
+        self.players_file = os.path.join(self.result_dir, "players.parquet")
+        self.identity_file = os.path.join(self.result_dir, "identity.json")
+        self.manifest_file = os.path.join(self.result_dir, "manifest.json")
+        self.lock_file = os.path.join(self.result_dir, "extract.lock")
+        self.run_stats_file = os.path.join(self.result_dir, "last_run.json")
+        self.quarantine_file = os.path.join(self.result_dir, "quarantine.json")
+
+    def __repr__(self):
+        return f"Profile({self.name})"
+
+
+def load_profiles():
+    # the default profile is set up in the .env file, all further ones in the profiles file
+    profiles = {DEFAULT_PROFILE: Profile(
+        watched_file = os.getenv("watched_file"),
+        backup_dir = os.getenv("backup_dir"),
+        my_profileid = os.getenv("my_profileid"),
+    )}
+    for name, settings in load_profile_settings().items():
+        assert name != DEFAULT_PROFILE, f"The {DEFAULT_PROFILE} profile is set up in the .env file."
+        profiles[name] = Profile(name, **settings)
+    return profiles
+
+def get_profile(name=DEFAULT_PROFILE):
+    return load_profiles()[name]
+
+def load_profile_settings():
+    try:
+        with open(PROFILES_FILE, "r") as infile:
+            return json.load(infile)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_profile(name, **settings):
+    # adds the profile or updates the given settings of it
+    assert name != DEFAULT_PROFILE, f"The {DEFAULT_PROFILE} profile is set up in the .env file."
+    profiles = load_profile_settings()
+    profiles[name] = profiles.get(name, {}) | settings
+    Profile(name, **profiles[name]) # fails for invalid names or settings
+    with open(PROFILES_FILE, "w") as outfile:
+        json.dump(profiles, outfile, indent=2)
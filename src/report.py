@@ -0,0 +1,155 @@
+import argparse
+import base64
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+import matplotlib
+matplotlib.use("Agg") # no display needed
+from matplotlib import pyplot as plt
+from extract import ingest
+from profiles import get_profile, DEFAULT_PROFILE
+import store
+from dataset import get_matches_version, load_matches, load_summary, load_my_id, load_profileid_map, load_teammate_effects
+from kpis import get_fighting_KPIs, get_mmr_KPIs
+from plots import plot_mmr_hisotry, plot_match_endings, plot_team_sizes, effect_on_success_chance
+
+
+REPORT_DIR = os.path.join("data", "reports")
+FORMATS = ["json", "html", "png"]
+SETTINGS = ["watched_file", "backup_dir", "my_profileid", "xml_backend", "live_ingestion"] # read from the .env file
+
+
+def main(roots, out_dir=REPORT_DIR, formats=FORMATS, extract=True, workers=1, profile=DEFAULT_PROFILE):
+    # every root is a directory laid out like this one, with its own backups and processed data
+    args = [(root, out_dir, formats, extract, profile) for root in roots]
+    if workers > 1 and len(roots) > 1:
+        with ProcessPoolExecutor(min(workers, len(roots))) as executor:
+            results = list(executor.map(try_create_report, *zip(*args)))
+    else:
+        results = [try_create_report(*arg) for arg in args]
+    failed = []
+    for root, (paths, error) in zip(roots, results):
+        if error is None:
+            print(f"Report for {root}: {', '.join(paths)}")
+        else:
+            print(f"No report for {root}: {error}")
+            failed.append(root)
+    return failed
+
+def try_create_report(*args):
+    # one root failing does not stop the reports of the others
+    try:
+        return create_report(*args), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+def create_report(root=".", out_dir=REPORT_DIR, formats=FORMATS, extract=True, profile=DEFAULT_PROFILE):
+    os.chdir(root) # all data paths are relative
+    load_settings(root)
+    if extract:
+        ingest(get_profile(profile))
+    report = compute_report(profile=profile)
+    os.makedirs(out_dir, exist_ok=True)
+    return write_report(report, out_dir, formats)
+
+def load_settings(root):
+    # settings of the app for this root, none are left over from roots reported before in the same process
+    for key in SETTINGS:
+        os.environ.pop(key, None)
+    load_dotenv(os.path.join(root, ".env"), override=True)
+
+def compute_report(trend_window=None, profile=DEFAULT_PROFILE):
+    assert store.exists(get_profile(profile).matches_dir), "No matches have been processed."
+    version = get_matches_version(profile)
+    matches, summary, my_id = load_matches(version, profile), load_summary(version, profile), load_my_id(version, profile)
+    trend_window = trend_window or max(2, len(summary) // 10)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "matches": len(summary),
+        "trend_window": trend_window,
+        "metrics": get_fighting_KPIs(summary, trend_window) + get_mmr_KPIs(matches, summary, my_id, trend_window),
+        "figures": {
+            "MMR History": plot_mmr_hisotry(matches, summary, my_id, "matchno", mmr_out=True),
+            "Match Results": plot_match_endings(summary),
+        },
+        "images": {},
+    }
+    report["images"]["Team Sizes"] = render_png(plot_team_sizes(summary))
+    try:
+        effects, minimum_matches = load_teammate_effects(version, "extracting with a bounty", profile=profile)
+        figure = effect_on_success_chance(effects, load_profileid_map(version, profile), my_id, minimum_matches=minimum_matches)
+        report["images"]["Teammate Analysis"] = render_png(figure)
+    except AssertionError as e:
+        print(f"Skipping teammate analysis: {e}")
+    return report
+
+def render_png(figure):
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(figure)
+    return buffer.getvalue()
+
+def write_report(report, out_dir, formats):
+    paths = []
+    if "json" in formats:
+        paths.append(os.path.join(out_dir, "report.json"))
+        with open(paths[-1], "w") as outfile:
+            json.dump({key: report[key] for key in ["created", "matches", "trend_window", "metrics"]}, outfile, indent=2, default=to_builtin)
+    if "png" in formats:
+        for name, image in report["images"].items():
+            paths.append(os.path.join(out_dir, f"{name.lower().replace(' ', '_')}.png"))
+            with open(paths[-1], "wb") as outfile:
+                outfile.write(image)
+    if "html" in formats:
+        paths.append(os.path.join(out_dir, "report.html"))
+        with open(paths[-1], "w", encoding="utf-8") as outfile:
+            outfile.write(render_html(report))
+    return paths
+
+def render_html(report):
+    metrics = "\n".join(
+        f"<tr><td>{metric['label']}</td><td>{metric['value']}</td><td>{metric.get('delta') or ''}</td></tr>"
+        for metric in report["metrics"]
+    )
+    figures = "\n".join(
+        f"<h2>{name}</h2>\n{figure.to_html(full_html=False, include_plotlyjs='cdn')}"
+        for name, figure in report["figures"].items()
+    )
+    images = "\n".join(
+        f'<h2>{name}</h2>\n<img src="data:image/png;base64,{base64.b64encode(image).decode()}"/>'
+        for name, image in report["images"].items()
+    )
+    return f"""<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Hunt Journal</title></head>
+<body style="background-color: #0e1117; color: white; font-family: sans-serif;">
+<h1>Hunt Journal</h1>
+<p>{report['matches']} matches, created {report['created']}</p>
+<table>
+<tr><th>Metric</th><th>Value</th><th>Trend</th></tr>
+{metrics}
+</table>
+{figures}
+{images}
+</body>
+</html>
+"""
+
+def to_builtin(value):
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the statistics as static reports, without starting the app.")
+    parser.add_argument("roots", nargs="*", default=["."], help="Directories with a data folder like this one. Defaults to the current one.")
+    parser.add_argument("--out", default=REPORT_DIR, help="Output directory, relative to each root.")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    parser.add_argument("--no-extract", action="store_true", help="Only report on already processed matches.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of roots processed at the same time.")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, help="Profile to report on.")
+    args = parser.parse_args()
+    failed = main([os.path.abspath(root) for root in args.roots], args.out, args.formats, not args.no_extract, args.workers, args.profile)
+    raise SystemExit(1 if len(failed) > 0 else 0)
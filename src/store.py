@@ -0,0 +1,124 @@
+import os
+import shutil
+from uuid import uuid4
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+PARTITION_COLUMN = "month"
+INDEX_COLUMNS = ["matchno", "teamno", "playerno"]
+SCHEMA = { # dtypes of the match table, all other text columns are stored as categories
+    "matchno": "int32",
+    "teamno": "int8",
+    "playerno": "int8",
+    "profileid": "category",
+    "blood_line_name": "category",
+    "bountyextracted": "int8",
+    "bountypickedup": "int8",
+    "downedbyme": "int8",
+    "downedbyteammate": "int8",
+    "downedme": "int8",
+    "downedteammate": "int8",
+    "killedbyme": "int8",
+    "killedbyteammate": "int8",
+    "killedme": "int8",
+    "killedteammate": "int8",
+    "mmr": "int16",
+    "bracket": "int8",
+    "hadWellspring": "bool",
+    "hadbounty": "bool",
+    "ispartner": "bool",
+    "issoulsurvivor": "bool",
+    "proximity": "bool",
+    "proximitytome": "bool",
+    "proximitytoteammate": "bool",
+    "skillbased": "bool",
+    "teamextraction": "bool",
+    "survival": "bool",
+    "mmr_team": "int16",
+    "handicap": "int16",
+    "numplayers": "int8",
+    "ownteam": "bool",
+    "isinvite": "bool",
+}
+
+
+def write_matches(matches, directory, append=False):
+    # matches are stored in one folder per month of play, appending only adds new files
+    matches = compact(matches)
+    if append:
+        write_partitions(matches, directory)
+    else: # build next to the old store and swap, so readers never see a half written store
+        temp_directory = f"{directory}.{uuid4().hex}.tmp"
+        write_partitions(matches, temp_directory)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.rename(temp_directory, directory)
+
+def write_partitions(matches, directory):
+    os.makedirs(directory, exist_ok=True)
+    months = matches["datetime_match_ended"].dt.strftime("%Y-%m")
+    for month, part in matches.groupby(months):
+        partition = os.path.join(directory, f"{PARTITION_COLUMN}={month}")
+        os.makedirs(partition, exist_ok=True)
+        filename = f"part-{part['matchno'].min():08d}.parquet"
+        temp_path = os.path.join(partition, f".{filename}.tmp") # hidden files are ignored when reading
+        part.to_parquet(temp_path, index=False)
+        os.replace(temp_path, os.path.join(partition, filename))
+
+def read_matches(directory, columns=None, start=None, end=None):
+    filters = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        filters += [(PARTITION_COLUMN, ">=", start.strftime("%Y-%m")), ("datetime_match_ended", ">=", start)]
+    if end is not None:
+        end = pd.Timestamp(end)
+        filters += [(PARTITION_COLUMN, "<=", end.strftime("%Y-%m")), ("datetime_match_ended", "<=", end)]
+    matches = pd.read_parquet(directory, columns=columns, filters=filters or None, schema=get_schema(directory))
+    if PARTITION_COLUMN in matches.columns and (columns is None or PARTITION_COLUMN not in columns):
+        del matches[PARTITION_COLUMN]
+    order = [column for column in INDEX_COLUMNS if column in matches.columns]
+    if len(order) > 0:
+        matches = matches.sort_values(order, ignore_index=True)
+    return matches
+
+def get_schema(directory):
+    # columns of all parts, appended parts might add columns or have more categories than the first one
+    dataset = ds.dataset(directory, format="parquet", partitioning="hive")
+    fields = {}
+    for fragment in dataset.get_fragments():
+        for field in fragment.physical_schema:
+            if pa.types.is_dictionary(field.type):
+                field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+            fields.setdefault(field.name, field)
+    fields.setdefault(PARTITION_COLUMN, dataset.schema.field(PARTITION_COLUMN))
+    return pa.schema(list(fields.values()))
+
+def write_table(table, path):
+    # small tables are kept in a single file, replaced as a whole
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid4().hex}.tmp"
+    table.to_parquet(temp_path, index=False)
+    os.replace(temp_path, path)
+
+def read_table(path, columns=None):
+    return pd.read_parquet(path, columns=columns)
+
+def get_version(path):
+    # changes whenever matches are written or the store is rebuilt
+    if os.path.isfile(path):
+        return os.path.getmtime(path)
+    return max([os.path.getmtime(root) for root, _, _ in os.walk(path)], default=None)
+
+def exists(directory):
+    return os.path.isdir(directory) and len(os.listdir(directory)) > 0
+
+def clear(directory):
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+
+def compact(matches):
+    matches = matches[INDEX_COLUMNS + [column for column in matches.columns if column not in INDEX_COLUMNS]]
+    dtypes = {column: SCHEMA.get(column, "category") for column in matches.columns if column in SCHEMA or matches[column].dtype == object}
+    return matches.astype(dtypes)
@@ -1,63 +1,222 @@
 from time import sleep
 from datetime import datetime
 import os
-from shutil import copy2 as copyfile
 import threading
+from glob import glob
+from xml.parsers.expat import ExpatError
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError: # fall back to polling
+    Observer = None
+    FileSystemEventHandler = object
+from profiles import load_profiles
 
 
-BACKUP_DIR = os.path.join("data", "raw")
 TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S%f"
 CHECK_FILE_AFTER = 60 # in seconds
+WRITE_SETTLE_TIME = 0.5 # in seconds, wait this long after the last write event before making a backup
 
 
 class FileBackupper(threading.Thread):
-    def __init__(self, watched_file, backup_dir):
+    def __init__(self, profile, event_driven=True, ingest=False):
         threading.Thread.__init__(self)
         self.stop_event = threading.Event()
-        assert os.path.exists(watched_file)
-        self.watched_file = watched_file
+        self.change_event = threading.Event()
+        assert profile.watched_file and os.path.exists(profile.watched_file), f"Matchfile of profile {profile.name} not found."
+        self.profile = profile
+        self.watched_file = profile.watched_file
         self.last_modified = self.get_last_modified()
-        assert os.path.isdir(backup_dir)
-        self.backup_dir = backup_dir
+        os.makedirs(profile.backup_dir, exist_ok=True)
+        self.backup_dir = profile.backup_dir
+        self.event_driven = event_driven and Observer is not None
+        self.ingest = ingest
+        self.ingest_event = threading.Event()
+        self.last_content_hash, self.last_match_hash = self.get_last_backup_hashes()
         
     def run(self):
+        if self.ingest:
+            # updating the statistics takes a while, new snapshots are captured in the meantime
+            threading.Thread(target=self.run_ingestion, daemon=True).start()
+        if self.event_driven:
+            self.run_event_driven()
+        else:
+            self.run_polling()
+
+    def run_polling(self):
         while not self.stop_event.wait(CHECK_FILE_AFTER):
-            if self.last_modified != self.get_last_modified():
-                self.last_modified = self.get_last_modified()
-                self.backup()
+            self.check_for_changes()
+
+    def run_event_driven(self):
+        observer = Observer()
+        observer.schedule(
+            WatchedFileHandler(self.watched_file, self.change_event),
+            os.path.dirname(os.path.abspath(self.watched_file)),
+        )
+        observer.start()
+        try:
+            while not self.stop_event.is_set():
+                if not self.change_event.wait(CHECK_FILE_AFTER):
+                    self.check_for_changes() # keep polling in case events got lost
+                    continue
+                # the game might write the file in several steps, only copy once it settled
+                self.change_event.clear()
+                while self.change_event.wait(WRITE_SETTLE_TIME) and not self.stop_event.is_set():
+                    self.change_event.clear()
+                if not self.stop_event.is_set():
+                    self.check_for_changes()
+        finally:
+            observer.stop()
+            observer.join()
+
+    def check_for_changes(self):
+        if self.last_modified != self.get_last_modified():
+            self.last_modified = self.get_last_modified()
+            self.backup()
     
     def stop(self):
         self.stop_event.set()
+        self.change_event.set() # wake up the event loop
+        self.ingest_event.set()
 
     def get_last_modified(self):
         return os.path.getmtime(self.watched_file)
 
     def backup(self):
-        timestamp = datetime.fromtimestamp(self.get_last_modified()).strftime(TIMESTAMP_FORMAT)
-        destination_path = os.path.join(
-            self.backup_dir,
-            f"{os.path.basename(os.path.splitext(self.watched_file)[0])}_{timestamp}{os.path.splitext(self.watched_file)[-1]}",
-        )
-        copyfile(self.watched_file, destination_path)
+        snapshot = self.read_snapshot()
+        if snapshot is None:
+            print("Matchfile is still being written, skipping.")
+            return
+        content, modified = snapshot
+        try:
+            content_hash, match_hash = get_hashes(content)
+        except ExpatError: # incomplete file, the next write will trigger another backup
+            print("Matchfile is incomplete, skipping.")
+            return
+        if content_hash == self.last_content_hash:
+            return
+        if match_hash is not None and match_hash == self.last_match_hash:
+            print("Match data did not change, skipping.")
+            return
+        destination_path = self.get_backup_path(modified)
+        # write to a temporary file first, so no partial copy ever shows up in the backup dir
+        temp_path = destination_path + ".tmp"
+        with open(temp_path, "wb") as outfile:
+            outfile.write(content)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.utime(temp_path, (modified, modified))
+        os.replace(temp_path, destination_path)
+        self.last_content_hash, self.last_match_hash = content_hash, match_hash
         print("Saved", destination_path)
+        if self.ingest and match_hash is not None:
+            self.ingest_event.set()
+
+    def run_ingestion(self):
+        # backups made while ingesting are picked up together by the next run
+        while True:
+            self.ingest_event.wait()
+            if self.stop_event.is_set():
+                return
+            self.ingest_event.clear()
+            self.ingest_backups()
+
+    def ingest_backups(self):
+        import extract # not on module level, since extract imports from here
+        try:
+            extract.ingest(self.profile)
+        except Exception as e:
+            print(f"Could not update statistics: {e}")
+        else:
+            print(f"Updated statistics of profile {self.profile.name}.")
+
+    def read_snapshot(self, attempts=3):
+        # make sure the file did not change while reading it
+        for _ in range(attempts):
+            before = os.stat(self.watched_file)
+            with open(self.watched_file, "rb") as infile:
+                content = infile.read()
+            after = os.stat(self.watched_file)
+            if (before.st_mtime, before.st_size) == (after.st_mtime, after.st_size) == (after.st_mtime, len(content)):
+                return content, after.st_mtime
+            sleep(WRITE_SETTLE_TIME)
+
+    def get_backup_path(self, modified):
+        name, extension = os.path.splitext(os.path.basename(self.watched_file))
+        timestamp = datetime.fromtimestamp(modified).strftime(TIMESTAMP_FORMAT)
+        return os.path.join(self.backup_dir, f"{name}_{timestamp}{extension}")
+
+    def get_last_backup_hashes(self):
+        name, extension = os.path.splitext(os.path.basename(self.watched_file))
+        backups = sorted(glob(os.path.join(self.backup_dir, f"{name}_*{extension}")))
+        if len(backups) == 0:
+            return None, None
+        with open(backups[-1], "rb") as infile:
+            content = infile.read()
+        try:
+            return get_hashes(content)
+        except ExpatError:
+            return None, None
+
+
+def get_hashes(content):
+    # same notion of identical files and matches as used during extraction,
+    # match hash is None if there is no valid match in the file
+    import extract # not on module level, since extract imports from here
+    content_hash = extract.hash_content(content)
+    try:
+        match = extract.parse_xml_cached(content, extract.get_xml_backend(), content_hash)
+    except ExpatError:
+        raise
+    except Exception:
+        return content_hash, None
+    return content_hash, extract.create_match_hash(match)
+
+
+class WatchedFileHandler(FileSystemEventHandler):
+    # signals writes to, creation of or renames onto the watched file
+    def __init__(self, watched_file, change_event):
+        self.watched_file = os.path.abspath(watched_file)
+        self.change_event = change_event
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type in ["deleted", "opened", "closed_no_write"]:
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        if self.watched_file in [os.path.abspath(path) for path in paths if path]:
+            self.change_event.set()
 
 
-def main(watched_file, backup_dir=BACKUP_DIR):
-    thread = FileBackupper(watched_file, backup_dir)
-    thread.start()
+def main(profiles, ingest=False):
+    # one recorder per profile, profiles without a matchfile are not recorded
+    threads = []
+    for profile in profiles:
+        if not profile.watched_file:
+            continue
+        if not os.path.exists(profile.watched_file):
+            print(f"Matchfile of profile {profile.name} not found, not recording it:", profile.watched_file)
+            continue
+        threads.append(FileBackupper(profile, ingest=ingest))
+    assert len(threads) > 0, "No matchfile found."
+    for thread in threads:
+        thread.start()
     print("Recorder active...")
-    print("Watching", watched_file)
+    for thread in threads:
+        print("Watching", thread.watched_file, f"({thread.profile.name})")
+    if ingest:
+        print("Statistics are updated after every match.")
     try:
         while True:
             sleep(2)
     except KeyboardInterrupt:
-        thread.stop()
+        for thread in threads:
+            thread.stop()
 
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
     load_dotenv()
     main(
-        watched_file = os.getenv("watched_file"), 
-        backup_dir = os.getenv("backup_dir") or BACKUP_DIR,
+        profiles = load_profiles().values(),
+        ingest = os.getenv("live_ingestion") == "true",
     )